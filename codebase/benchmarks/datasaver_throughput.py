@@ -0,0 +1,153 @@
+"""
+Benchmark how fast DataSaver.update_multiple_results absorbs synthetic I/Q batches shaped
+like the routines, across chunking, flush and compression settings. No hardware needed.
+
+Scenarios:
+    "1d": sweeps of 250 points, e.g. a power Rabi or T1 scan
+    "3d": (qu_a, rr_a, rr_f) buffers as in ResonatorSpectroscopy
+
+For each scenario and setting, it reports the per batch latency percentiles, the
+throughput and the final file size. With --min-mbps, it exits with an error if any
+setting is slower, to catch regressions; --json saves the results to compare runs.
+
+usage:
+    python -m qcrew.codebase.benchmarks.datasaver_throughput --reps 10000 --batch 200
+    python -m qcrew.codebase.benchmarks.datasaver_throughput --scenario 3d --min-mbps 50
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from qcrew.codebase.benchmarks.storage_policy import make_iq_batches
+from qcrew.codebase.datasaver.hdf5_helper import (
+    DataSaver,
+    FlushPolicy,
+    StoragePolicy,
+    initialise_database,
+)
+
+SCENARIOS = {
+    "1d": (250,),
+    "3d": (3, 4, 41),  # (qu_a, rr_a, rr_f)
+}
+
+# name -> DataSaver keyword arguments, "total_count" is filled in by run
+SETTINGS = {
+    "default": {},
+    "flush exit": {"flush_policy": FlushPolicy("exit")},
+    "flush 1 s": {"flush_policy": FlushPolicy("interval", seconds=1)},
+    "chunks=1024": {"storage": StoragePolicy(chunks=1024)},
+    "preallocated": {"total_count": True},
+    "lzf + shuffle": {
+        "storage": StoragePolicy(chunks=1024, compression="lzf", shuffle=True)
+    },
+    "gzip 4 + shuffle": {
+        "storage": StoragePolicy(
+            chunks=1024, compression="gzip", compression_opts=4, shuffle=True
+        )
+    },
+    "async": {"async_write": True},
+    "async + flush exit": {"async_write": True, "flush_policy": FlushPolicy("exit")},
+}
+
+
+def run(setting: dict, batches: list, path: str) -> dict:
+    """
+    Save all the batches with the DataSaver arguments "setting", return the per batch
+    latencies (s), total time (s) and file size (bytes).
+    """
+    kwargs = dict(setting)
+    if kwargs.get("total_count"):
+        kwargs["total_count"] = sum(i_data.shape[0] for i_data, _ in batches)
+    # fresh policy objects, they keep the time and size of the last flush
+    if "flush_policy" in kwargs:
+        policy = kwargs["flush_policy"]
+        kwargs["flush_policy"] = FlushPolicy(policy.mode, policy.seconds, policy.nbytes)
+
+    db = initialise_database(
+        exp_name="benchmark", sample_name="throughput", project_name="bench", path=path
+    )
+    filepath = db.filepath
+    latencies = []
+    start = time.perf_counter()
+    with DataSaver(db, **kwargs) as datasaver:
+        for i_data, q_data in batches:
+            batch_start = time.perf_counter()
+            datasaver.update_multiple_results(
+                {"I": i_data, "Q": q_data}, save=["I", "Q"], group="data"
+            )
+            latencies.append(time.perf_counter() - batch_start)
+    # the time to drain the writer and close the file counts in the throughput
+    elapsed = time.perf_counter() - start
+    return {
+        "latencies": np.array(latencies),
+        "elapsed": elapsed,
+        "size": os.path.getsize(filepath),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenario", choices=SCENARIOS, nargs="+", default=list(SCENARIOS))
+    parser.add_argument("--setting", choices=SETTINGS, nargs="+", default=list(SETTINGS))
+    parser.add_argument("--reps", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--min-mbps", type=float, help="fail below this throughput")
+    parser.add_argument("--json", help="save the results in this file")
+    args = parser.parse_args()
+
+    report, too_slow = [], []
+    for scenario in args.scenario:
+        batches = make_iq_batches(args.reps, SCENARIOS[scenario], args.batch)
+        raw_bytes = sum(i.nbytes + q.nbytes for i, q in batches)
+        with tempfile.TemporaryDirectory() as path:
+            results = {
+                name: run(SETTINGS[name], batches, path) for name in args.setting
+            }
+
+        print(
+            f"\n{scenario}: sweep {SCENARIOS[scenario]}, "
+            f"{raw_bytes / 1e6:.1f} MB in {len(batches)} batches"
+        )
+        print(
+            f"{'setting':<22}{'p50 (ms)':>10}{'p90 (ms)':>10}{'p99 (ms)':>10}"
+            f"{'max (ms)':>10}{'MB/s':>9}{'size (MB)':>11}"
+        )
+        for name, result in results.items():
+            p50, p90, p99 = np.percentile(result["latencies"], (50, 90, 99)) * 1e3
+            mbps = raw_bytes / 1e6 / result["elapsed"]
+            print(
+                f"{name:<22}{p50:>10.2f}{p90:>10.2f}{p99:>10.2f}"
+                f"{result['latencies'].max() * 1e3:>10.2f}{mbps:>9.1f}"
+                f"{result['size'] / 1e6:>11.2f}"
+            )
+            report.append(
+                {
+                    "scenario": scenario,
+                    "setting": name,
+                    "p50_ms": p50,
+                    "p90_ms": p90,
+                    "p99_ms": p99,
+                    "mbps": mbps,
+                    "size_mb": result["size"] / 1e6,
+                }
+            )
+            if args.min_mbps is not None and mbps < args.min_mbps:
+                too_slow.append(f"{scenario} / {name}: {mbps:.1f} MB/s")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if too_slow:
+        print(f"\nBelow {args.min_mbps} MB/s:\n  " + "\n  ".join(too_slow))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
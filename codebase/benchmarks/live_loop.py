@@ -0,0 +1,145 @@
+"""
+Benchmark the live measurement loop of the v4 scripts end to end, against simulated QM
+result handles: fetch -> save -> stats (RunningStats) -> plot (Plotter.live_plot with a fit).
+
+It reports the latency distribution of each stage, the sustained repetitions per second
+and whether the loop keeps up with the simulated job. With --budget, it exits with an
+error if the p90 work time of an iteration, all stages but the wait for new results, is
+over budget.
+
+usage:
+    python -m qcrew.codebase.benchmarks.live_loop --reps 5000 --sweep 250 --rate 1000
+    python -m qcrew.codebase.benchmarks.live_loop --sweep 3 4 41 --stages fetch save stats --budget 0.2
+"""
+import argparse
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from qcrew.codebase.datasaver.hdf5_helper import DataSaver, initialise_database
+from qcrew.codebase.utils.fetcher import Fetcher
+from qcrew.codebase.utils.qm_simulator import simulate_iq_job
+from qcrew.codebase.utils.statistician import RunningStats
+
+STAGES = ("fetch", "save", "stats", "plot")
+
+
+def run_loop(args, path: str) -> tuple:
+    """
+    Run the live loop on a simulated job, return the per iteration stage durations
+    {stage: [s]}, the wait durations [s] and the total time (s).
+    """
+    job = simulate_iq_job(
+        reps=args.reps, sweep_points=tuple(args.sweep), rate=args.rate, latency=args.latency
+    )
+    plotter = None
+    if "plot" in args.stages:
+        # imported here, the plot stage needs matplotlib, IPython and lmfit
+        from qcrew.codebase.utils.plotter import Plotter
+
+        plotter = Plotter(title="benchmark", xlabel="sweep")
+
+    db = initialise_database(
+        exp_name="benchmark", sample_name="live_loop", project_name="bench", path=path
+    )
+    timings = {stage: [] for stage in args.stages}
+    waits = []
+    stats = RunningStats()
+    start = time.perf_counter()
+
+    fetcher = Fetcher(handle=job.result_handles, num_results=args.reps, static_tags=["X"])
+    with DataSaver(db, async_write=args.async_write) as datasaver:
+        while fetcher.is_fetching:
+            fetch_start = time.perf_counter()
+            (num_so_far, update_results) = fetcher.fetch(
+                min_new=1, min_period=args.period
+            )
+            fetch_end = time.perf_counter()
+            if not update_results:
+                continue
+            if "fetch" in timings:
+                timings["fetch"].append(fetcher.fetch_time)
+            waits.append(fetch_end - fetch_start - fetcher.fetch_time)
+
+            if "save" in timings:
+                stage_start = time.perf_counter()
+                datasaver.update_multiple_results(
+                    update_results, save=["I", "Q"], group="data"
+                )
+                timings["save"].append(time.perf_counter() - stage_start)
+
+            if "stats" in timings:
+                stage_start = time.perf_counter()
+                stats.update(np.sqrt(update_results["Y_SQ_RAW"]))
+                timings["stats"].append(time.perf_counter() - stage_start)
+
+            if plotter is not None:
+                stage_start = time.perf_counter()
+                ys = np.sqrt(update_results["Y_AVG"])
+                xs = update_results["X"]
+                plotter.live_plot(xs, ys, num_so_far, fit_fn=args.fit_fn, err=stats.std_err)
+                timings["plot"].append(time.perf_counter() - stage_start)
+    elapsed = time.perf_counter() - start
+    return timings, np.array(waits), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--reps", type=int, default=5000)
+    parser.add_argument("--sweep", type=int, nargs="+", default=[250])
+    parser.add_argument("--rate", type=float, default=1000, help="simulated reps per second")
+    parser.add_argument("--latency", type=float, default=0.002, help="QM call latency (s)")
+    parser.add_argument("--period", type=float, default=0.0, help="fetch min_period (s)")
+    parser.add_argument("--stages", choices=STAGES, nargs="+", default=list(STAGES))
+    parser.add_argument("--fit-fn", default="sine")
+    parser.add_argument("--async-write", action="store_true")
+    parser.add_argument("--budget", type=float, help="per iteration work budget (s)")
+    args = parser.parse_args()
+    if len(args.sweep) > 1 and "plot" in args.stages:
+        parser.error("the plot stage needs a 1d sweep")
+
+    with tempfile.TemporaryDirectory() as path:
+        timings, waits, elapsed = run_loop(args, path)
+
+    iterations = len(waits)
+    work = np.sum([timings[stage] for stage in args.stages], axis=0)
+    print(
+        f"\n{args.reps} reps of {tuple(args.sweep)} at {args.rate:.0f} reps/s, "
+        f"{iterations} iterations in {elapsed:.2f} s"
+    )
+    print(
+        f"{'stage':<8}{'p50 (ms)':>10}{'p90 (ms)':>10}{'p99 (ms)':>10}"
+        f"{'max (ms)':>10}{'share':>8}"
+    )
+    rows = [(stage, np.array(timings[stage])) for stage in args.stages]
+    rows += [("work", work), ("wait", waits)]
+    for name, durations in rows:
+        p50, p90, p99 = np.percentile(durations, (50, 90, 99)) * 1e3
+        share = durations.sum() / elapsed
+        print(
+            f"{name:<8}{p50:>10.2f}{p90:>10.2f}{p99:>10.2f}"
+            f"{durations.max() * 1e3:>10.2f}{share:>8.0%}"
+        )
+
+    sustained = args.reps / elapsed
+    job_time = args.reps / args.rate
+    print(
+        f"sustained: {sustained:.0f} reps/s, "
+        f"loop finished {elapsed - job_time:.2f} s after the job"
+    )
+
+    if args.budget is not None:
+        p50, p90 = np.percentile(work, (50, 90))
+        if p90 > args.budget:
+            print(
+                f"Over budget: p50 {p50 * 1e3:.1f} ms, p90 {p90 * 1e3:.1f} ms "
+                f"for {args.budget * 1e3:.1f} ms per iteration"
+            )
+            sys.exit(1)
+        print(f"Within the {args.budget * 1e3:.1f} ms budget")
+
+
+if __name__ == "__main__":
+    main()
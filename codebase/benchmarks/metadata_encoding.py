@@ -0,0 +1,146 @@
+"""
+Benchmark the "groups" (write_dict_to_hdf5) and "json" (write_dict_to_json_hdf5) metadata
+encodings on a synthetic snapshot shaped like Stage.parameters, and check that the json
+encoding reads back the snapshot it was given.
+
+usage:
+    python -m qcrew.codebase.benchmarks.metadata_encoding --elements 10 --pulses 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from qcrew.codebase.datasaver.hdf5_helper import (
+    read_dict_from_hdf5,
+    read_json_from_hdf5,
+    write_dict_to_hdf5,
+    write_dict_to_json_hdf5,
+)
+
+ENCODERS = {
+    "groups": write_dict_to_hdf5,
+    "json": write_dict_to_json_hdf5,
+}
+
+
+def make_snapshot(num_elements: int, num_pulses: int, num_samples: int) -> dict:
+    """
+    Return a nested dictionary imitating a stage snapshot: elements with their
+    frequencies and mixer settings, pulses with their waveform sample lists.
+    """
+    rng = np.random.default_rng(0)
+    elements = {}
+    for i in range(num_elements):
+        elements[f"element_{i}"] = {
+            "lo_freq": 5e9 + i * 1e8,
+            "int_freq": -50e6,
+            "ports": {"I": 2 * i + 1, "Q": 2 * i + 2},
+            "mixer_offsets": [0.01, -0.02],
+            "mixer_correction": (1.0, 0.0, 0.0, 1.0),
+            "iq_imbalance": np.complex128(0.98 + 0.01j * i),
+            "reflection": np.array([0.5 + 0.1j, -0.2 + 0.3j]),
+            "operations": {
+                f"pulse_{j}": {
+                    "length": 100 + 4 * j,
+                    "waveforms": {
+                        "I": list(rng.normal(0, 0.1, num_samples)),
+                        "Q": list(rng.normal(0, 0.1, num_samples)),
+                    },
+                    "digital_marker": "ON",
+                    "envelope": rng.normal(0, 0.1, num_samples)
+                    + 1j * rng.normal(0, 0.1, num_samples),
+                    "integration_weights": [
+                        {"cos": [1.0] * 4, "sin": [0.0] * 4} for _ in range(2)
+                    ],
+                }
+                for j in range(num_pulses)
+            },
+        }
+    return {"stage": {"name": "stage", "elements": elements}, "reps": 1000}
+
+
+def count_objects(entry_point) -> int:
+    count = []
+    entry_point.visit(count.append)
+    return len(count)
+
+
+def same(expected, actual) -> bool:
+    """ Compare a snapshot with the one read back, numeric lists may come back as arrays """
+    if isinstance(expected, dict):
+        return (
+            isinstance(actual, dict)
+            and expected.keys() == actual.keys()
+            and all(same(value, actual[key]) for key, value in expected.items())
+        )
+    if isinstance(expected, (list, tuple, np.ndarray)) and not isinstance(actual, str):
+        if isinstance(expected, tuple) and not isinstance(actual, tuple):
+            return False
+        try:
+            return np.array_equal(np.asarray(expected), np.asarray(actual))
+        except (TypeError, ValueError):
+            return len(expected) == len(actual) and all(map(same, expected, actual))
+    if isinstance(expected, (int, float, complex, np.number)) and not isinstance(
+        expected, (bool, np.bool_)
+    ):
+        return isinstance(actual, (int, float, complex, np.number)) and expected == actual
+    return type(expected) == type(actual) and expected == actual
+
+
+def check_round_trip(snapshot: dict, path: str) -> bool:
+    filepath = os.path.join(path, "round_trip.h5")
+    with h5py.File(filepath, "w") as file:
+        write_dict_to_json_hdf5(snapshot, file)
+    with h5py.File(filepath, "r") as file:
+        return same(snapshot, read_json_from_hdf5(file))
+
+
+def run(encoder: str, snapshot: dict, path: str) -> tuple:
+    """
+    Return the write time, read time, number of hdf5 objects and file size.
+    """
+    filepath = os.path.join(path, f"{encoder}.h5")
+    with h5py.File(filepath, "w") as file:
+        start = time.perf_counter()
+        ENCODERS[encoder](snapshot, file)
+        file.flush()
+        write_time = time.perf_counter() - start
+        num_objects = count_objects(file)
+
+    with h5py.File(filepath, "r") as file:
+        start = time.perf_counter()
+        read_dict_from_hdf5({}, file)
+        read_time = time.perf_counter() - start
+
+    return write_time, read_time, num_objects, os.path.getsize(filepath)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--elements", type=int, default=10)
+    parser.add_argument("--pulses", type=int, default=20)
+    parser.add_argument("--samples", type=int, default=200)
+    args = parser.parse_args()
+
+    snapshot = make_snapshot(args.elements, args.pulses, args.samples)
+    print(f"{'encoding':<10}{'write (s)':>12}{'read (s)':>12}{'objects':>10}{'size (MB)':>12}")
+    with tempfile.TemporaryDirectory() as path:
+        for encoder in ENCODERS:
+            write_time, read_time, num_objects, size = run(encoder, snapshot, path)
+            print(
+                f"{encoder:<10}{write_time:>12.3f}{read_time:>12.3f}"
+                f"{num_objects:>10}{size / 1e6:>12.2f}"
+            )
+        if not check_round_trip(snapshot, path):
+            print("FAILED: the json encoding does not read back the snapshot")
+            sys.exit(1)
+    print("json round trip OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark the append latency and read throughput of the results backends (hdf5 file,
+chunk directory, memory mapped npy) on synthetic raw I/Q data.
+
+usage:
+    python -m qcrew.codebase.benchmarks.storage_backend --reps 20000 --sweep 21 --batch 500
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from qcrew.codebase.benchmarks.storage_policy import make_iq_batches
+from qcrew.codebase.datasaver.backends import BACKENDS, create_backend
+
+
+def run(backend_name: str, batches: list, path: str) -> tuple:
+    """
+    Append all the batches, then read back each result in full and by blocks of
+    repetitions. Return the append latencies (s), full read time (s) and block read time
+    (s).
+    """
+    total_count = sum(i_data.shape[0] for i_data, _ in batches)
+    database_path = os.path.join(path, f"{backend_name}.h5")
+    latencies = []
+    with create_backend(backend_name, database_path, total_count=total_count) as backend:
+        for i_data, q_data in batches:
+            start = time.perf_counter()
+            backend.append("data/I", i_data)
+            backend.append("data/Q", q_data)
+            backend.flush()  # the DataSaver default flush policy
+            latencies.append(time.perf_counter() - start)
+
+    backend = BACKENDS[backend_name](backend.path, mode="r")
+    with backend:
+        start = time.perf_counter()
+        for key in ("data/I", "data/Q"):
+            backend.read(key)
+        full_read = time.perf_counter() - start
+
+        block = max(1, total_count // 20)
+        start = time.perf_counter()
+        for key in ("data/I", "data/Q"):
+            for first in range(0, total_count, block):
+                backend.read(key, first, first + block)
+        block_read = time.perf_counter() - start
+    return np.array(latencies), full_read, block_read
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--reps", type=int, default=20000)
+    parser.add_argument("--sweep", type=int, nargs="+", default=[21])
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+
+    batches = make_iq_batches(args.reps, tuple(args.sweep), args.batch)
+    raw_mb = sum(i.nbytes + q.nbytes for i, q in batches) / 1e6
+    with tempfile.TemporaryDirectory() as path:
+        results = {name: run(name, batches, path) for name in BACKENDS}
+
+    print(f"raw I/Q: {raw_mb:.1f} MB in {len(batches)} batches")
+    print(
+        f"{'backend':<10}{'append med (ms)':>17}{'append p99 (ms)':>17}"
+        f"{'read (MB/s)':>13}{'block read (MB/s)':>19}"
+    )
+    for name, (latencies, full_read, block_read) in results.items():
+        print(
+            f"{name:<10}{np.median(latencies) * 1e3:>17.2f}"
+            f"{np.percentile(latencies, 99) * 1e3:>17.2f}"
+            f"{raw_mb / full_read:>13.1f}{raw_mb / block_read:>19.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
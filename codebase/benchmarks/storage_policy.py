@@ -0,0 +1,94 @@
+"""
+Benchmark the write throughput and file size of the DataSaver storage policies on
+synthetic raw I/Q data.
+
+The data imitates the OPX output: gaussian blobs quantised to the 4.28 fixed point
+resolution, saved in batches of repetitions like the live measurement loop does.
+
+usage:
+    python -m qcrew.codebase.benchmarks.storage_policy --reps 20000 --sweep 21 --batch 500
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from qcrew.codebase.datasaver.hdf5_helper import (
+    DataSaver,
+    StoragePolicy,
+    initialise_database,
+)
+
+POLICIES = {
+    "auto chunks": StoragePolicy(),
+    "chunks=1024": StoragePolicy(chunks=1024),
+    "lzf": StoragePolicy(chunks=1024, compression="lzf"),
+    "lzf + shuffle": StoragePolicy(chunks=1024, compression="lzf", shuffle=True),
+    "gzip 4 + shuffle": StoragePolicy(
+        chunks=1024, compression="gzip", compression_opts=4, shuffle=True
+    ),
+    "float32": StoragePolicy(chunks=1024, dtype="float32"),
+    "float32 + lzf + shuffle": StoragePolicy(
+        chunks=1024, compression="lzf", shuffle=True, dtype="float32"
+    ),
+}
+
+
+def make_iq_batches(reps: int, sweep: tuple, batch: int, seed: int = 0):
+    """
+    Return a list of (I, Q) batches of shape (batch, *sweep).
+    """
+    rng = np.random.default_rng(seed)
+    lsb = 2.0 ** -28  # resolution of the QUA fixed type
+    batches = []
+    for start in range(0, reps, batch):
+        n = min(batch, reps - start)
+        i_data = rng.normal(2e-4, 5e-5, size=(n,) + sweep)
+        q_data = rng.normal(-1e-4, 5e-5, size=(n,) + sweep)
+        batches.append((np.round(i_data / lsb) * lsb, np.round(q_data / lsb) * lsb))
+    return batches
+
+
+def run(policy: StoragePolicy, batches: list, path: str) -> tuple:
+    """
+    Write all the batches with the given policy, return (seconds, file size in bytes).
+    """
+    db = initialise_database(
+        exp_name="benchmark", sample_name="storage", project_name="bench", path=path
+    )
+    filepath = db.filepath
+    start = time.perf_counter()
+    with DataSaver(db, storage=policy) as datasaver:
+        for i_data, q_data in batches:
+            datasaver.update_multiple_results(
+                {"I": i_data, "Q": q_data}, save=["I", "Q"], group="data"
+            )
+    elapsed = time.perf_counter() - start
+    return elapsed, os.path.getsize(filepath)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--reps", type=int, default=20000)
+    parser.add_argument("--sweep", type=int, nargs="+", default=[21])
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+
+    batches = make_iq_batches(args.reps, tuple(args.sweep), args.batch)
+    raw_bytes = sum(i.nbytes + q.nbytes for i, q in batches)
+    with tempfile.TemporaryDirectory() as path:
+        results = {name: run(policy, batches, path) for name, policy in POLICIES.items()}
+
+    print(f"raw I/Q: {raw_bytes / 1e6:.1f} MB in {len(batches)} batches")
+    print(f"{'policy':<26}{'MB/s':>10}{'size (MB)':>12}{'ratio':>8}")
+    for name, (elapsed, size) in results.items():
+        print(
+            f"{name:<26}{raw_bytes / 1e6 / elapsed:>10.1f}"
+            f"{size / 1e6:>12.2f}{raw_bytes / size:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
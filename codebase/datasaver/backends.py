@@ -0,0 +1,400 @@
+"""
+Storage backends for the results streamed by DataHandle.update_result.
+
+This is narrower than a storage interface behind DataSaver/DataHandle: the DataHandle is
+still written for h5py, and only the results streamed by update_result can be sent to a
+backend. A backend is an optional sidecar store, the default path does not go through it:
+without one, DataHandle writes the results as datasets of the hdf5 database, with
+preallocation, SWMR, shards and the finalise step, none of which apply to a backend. The
+"hdf5" backend is a second hdf5 file next to the database, mostly useful as the reference
+to compare the other stores with. With
+DataSaver(db, backend=...) the results are written in another store next to the database,
+while the metadata, the fixed results of add_result, the previews and the aggregates stay
+in the database as usual. The database records the backend in its "results_backend"
+attribute, see open_results, and a DataSaver reopening the database appends to the same
+store. The StoragePolicy of a result sets its dtype in all the
+backends, its chunks and filters in "hdf5" and its repetitions per chunk in "chunks".
+
+The sidecar paths end with the backend suffix, which Catalog.rebuild skips.
+
+    "hdf5": HDF5Backend, resizable datasets of one hdf5 file
+    "chunks": ChunkDirectoryBackend, one .npy file per chunk of repetitions in a directory
+        per result, appendable and cheap to read in parallel, in the spirit of Zarr
+    "npy": NpyBackend, one .npy file per result preallocated at the total repetition
+        number and written through a memory map
+"""
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Union
+
+import h5py
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+BACKEND_ATTR = "results_backend"
+
+
+class StorageBackend:
+    """
+    Store of the result arrays, each result "key" (e.g. "data/I") grows along its first
+    axis, the repetitions.
+
+    Arguments:
+        path (str or Path): where the backend keeps its files
+        mode (str): "w" to write a new store, "a" to append to an existing one, "r" to
+            read an existing one
+    """
+
+    name = None
+    suffix = None  # added to the database file stem to get the backend path
+
+    def __init__(self, path: Union[str, Path], mode: str = "w"):
+        if mode not in ("w", "a", "r"):
+            raise ValueError(f'Backend mode should be "w", "a" or "r", got {mode}')
+        self.path = Path(path)
+        self.mode = mode
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback) -> None:
+        self.close()
+
+    def append(self, key: str, data: np.ndarray, storage=None) -> None:
+        """
+        Append the repetitions "data", of shape (repetitions, sweep...), to the result.
+        "storage" (StoragePolicy) is the layout of the result when it is created.
+        """
+        raise NotImplementedError
+
+    def read(self, key: str, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """
+        Return the repetitions start:stop of the result.
+        """
+        raise NotImplementedError
+
+    def shape(self, key: str) -> tuple:
+        raise NotImplementedError
+
+    def keys(self) -> list:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def _check_row_shape(self, key: str, row_shape: tuple, data: np.ndarray) -> None:
+        if data.shape[1:] != tuple(row_shape):
+            raise ValueError(
+                f'The received new data have the shape {data.shape}, while "{key}" has '
+                f"repetitions of shape {tuple(row_shape)}"
+            )
+
+
+class HDF5Backend(StorageBackend):
+    name = "hdf5"
+    suffix = ".results.h5"
+
+    def __init__(self, path: Union[str, Path], mode: str = "w"):
+        super().__init__(path, mode)
+        # an existing store is never truncated, it is reopened with mode "a"
+        self.file = h5py.File(self.path, "x" if mode == "w" else mode)
+
+    def append(self, key: str, data: np.ndarray, storage=None) -> None:
+        if key not in self.file:
+            kwargs = storage.dataset_kwargs(data.shape) if storage else {"chunks": True}
+            dataset = self.file.create_dataset(
+                key, data=data, maxshape=(None,) + data.shape[1:], **kwargs
+            )
+            if storage:
+                storage.record(dataset)
+            return
+        dataset = self.file[key]
+        self._check_row_shape(key, dataset.shape[1:], data)
+        dataset.resize(dataset.shape[0] + data.shape[0], axis=0)
+        dataset[-data.shape[0] :] = data
+
+    def read(self, key: str, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        return self.file[key][start:stop]
+
+    def shape(self, key: str) -> tuple:
+        return self.file[key].shape
+
+    def keys(self) -> list:
+        keys = []
+
+        def visit(name, item):
+            if isinstance(item, h5py.Dataset):
+                keys.append(name)
+
+        self.file.visititems(visit)
+        return keys
+
+    def flush(self) -> None:
+        if self.file:
+            self.file.flush()
+
+    def close(self) -> None:
+        if self.file:
+            self.file.close()
+
+
+class ChunkDirectoryBackend(StorageBackend):
+    """
+    Each result is a directory "<path>/<key>" with the chunks "<index>.npy" of
+    "chunk_rows" repetitions and an "array.json" descriptor. The repetitions of the last,
+    unfinished chunk are kept in memory and written on flush.
+
+    Arguments:
+        chunk_rows (int): number of repetitions per chunk, unless the StoragePolicy of the
+            result gives it as an int "chunks"
+        workers (int): number of threads loading the chunks in read
+    """
+
+    name = "chunks"
+    suffix = ".chunks"
+    DESCRIPTOR = "array.json"
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        mode: str = "w",
+        chunk_rows: int = 1000,
+        workers: int = 4,
+    ):
+        super().__init__(path, mode)
+        self.chunk_rows = chunk_rows
+        self.workers = workers
+        self._arrays = {}  # key -> descriptor
+        self._pending = {}  # key -> list of the rows of the unfinished chunk
+        if mode == "w":
+            self.path.mkdir(parents=True, exist_ok=False)
+        else:
+            for descriptor_path in self.path.rglob(self.DESCRIPTOR):
+                key = descriptor_path.parent.relative_to(self.path).as_posix()
+                array = json.loads(descriptor_path.read_text())
+                self._arrays[key] = array
+                if mode == "a":
+                    # the unfinished last chunk goes back to memory to be completed
+                    num_rows, chunk_rows = array["shape"][0], array["chunk_rows"]
+                    if num_rows % chunk_rows:
+                        pending = np.load(self._chunk_path(key, num_rows // chunk_rows))
+                    else:
+                        pending = np.empty(
+                            [0] + array["shape"][1:], dtype=array["dtype"]
+                        )
+                    self._pending[key] = pending
+
+    def _chunk_path(self, key: str, index: int) -> Path:
+        return self.path / key / f"{index}.npy"
+
+    def append(self, key: str, data: np.ndarray, storage=None) -> None:
+        if key not in self._arrays:
+            (self.path / key).mkdir(parents=True)
+            chunks = getattr(storage, "chunks", None)
+            if isinstance(chunks, bool) or not isinstance(chunks, int):
+                chunks = self.chunk_rows
+            self._arrays[key] = {
+                "shape": [0] + list(data.shape[1:]),
+                "dtype": data.dtype.str,
+                "chunk_rows": chunks,
+            }
+            self._pending[key] = np.empty((0,) + data.shape[1:], dtype=data.dtype)
+        array = self._arrays[key]
+        self._check_row_shape(key, array["shape"][1:], data)
+        chunk_rows = array["chunk_rows"]
+
+        # complete chunks are written once, the unfinished one stays in memory
+        pending = np.concatenate((self._pending[key], data.astype(array["dtype"])))
+        stored = array["shape"][0] - array["shape"][0] % chunk_rows
+        num_full = pending.shape[0] // chunk_rows
+        for i in range(num_full):
+            rows = pending[i * chunk_rows : (i + 1) * chunk_rows]
+            np.save(self._chunk_path(key, stored // chunk_rows + i), rows)
+        self._pending[key] = pending[num_full * chunk_rows :]
+        array["shape"][0] += data.shape[0]
+
+    def read(self, key: str, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        array = self._arrays[key]
+        chunk_rows = array["chunk_rows"]
+        start, stop, _ = slice(start, stop).indices(array["shape"][0])
+        if stop <= start:
+            return np.empty([0] + array["shape"][1:], dtype=array["dtype"])
+
+        indices = range(start // chunk_rows, (stop - 1) // chunk_rows + 1)
+        pending = self._pending.get(key)
+        written = len(indices)
+        if pending is not None and pending.shape[0] and indices[-1] == (
+            array["shape"][0] // chunk_rows
+        ):
+            written -= 1  # the last chunk is still in memory
+        with ThreadPoolExecutor(self.workers) as executor:
+            chunks = list(
+                executor.map(
+                    lambda index: np.load(self._chunk_path(key, index)),
+                    indices[:written],
+                )
+            )
+        if written < len(indices):
+            chunks.append(pending)
+        offset = indices[0] * chunk_rows
+        return np.concatenate(chunks)[start - offset : stop - offset]
+
+    def shape(self, key: str) -> tuple:
+        return tuple(self._arrays[key]["shape"])
+
+    def keys(self) -> list:
+        return list(self._arrays)
+
+    def flush(self) -> None:
+        if self.mode == "r":
+            return
+        for key, array in self._arrays.items():
+            pending = self._pending[key]
+            if pending.shape[0]:
+                index = array["shape"][0] // array["chunk_rows"]
+                np.save(self._chunk_path(key, index), pending)
+            (self.path / key / self.DESCRIPTOR).write_text(json.dumps(array))
+
+    def close(self) -> None:
+        self.flush()
+
+
+class NpyBackend(StorageBackend):
+    """
+    Each result is a "<path>/<key>.npy" file preallocated at "total_count" repetitions,
+    the number of filled repetitions is kept in "<path>/index.json". A result receiving
+    more repetitions than expected is reallocated with twice the room.
+
+    Arguments:
+        total_count (int): total number of repetitions, required in write mode
+    """
+
+    name = "npy"
+    suffix = ".npy.d"
+    INDEX = "index.json"
+
+    def __init__(
+        self, path: Union[str, Path], mode: str = "w", total_count: Optional[int] = None
+    ):
+        super().__init__(path, mode)
+        self.total_count = total_count
+        self._arrays = {}  # key -> memmap
+        self._fill_counts = {}
+        if mode == "w":
+            if total_count is None:
+                raise ValueError("The npy backend needs the total repetition number")
+            self.path.mkdir(parents=True, exist_ok=False)
+        else:
+            self._fill_counts = json.loads((self.path / self.INDEX).read_text())
+            mmap_mode = "r+" if mode == "a" else "r"
+            for key in self._fill_counts:
+                self._arrays[key] = np.load(self._array_path(key), mmap_mode=mmap_mode)
+
+    def _array_path(self, key: str) -> Path:
+        return self.path / f"{key}.npy"
+
+    def append(self, key: str, data: np.ndarray, storage=None) -> None:
+        if key not in self._arrays:
+            if self.total_count is None:
+                raise ValueError("The npy backend needs the total repetition number")
+            self._array_path(key).parent.mkdir(parents=True, exist_ok=True)
+            self._arrays[key] = np.lib.format.open_memmap(
+                self._array_path(key),
+                mode="w+",
+                dtype=data.dtype,
+                shape=(self.total_count,) + data.shape[1:],
+            )
+            self._fill_counts[key] = 0
+        array = self._arrays[key]
+        self._check_row_shape(key, array.shape[1:], data)
+
+        fill_count = self._fill_counts[key]
+        if fill_count + data.shape[0] > array.shape[0]:
+            log.warning(
+                f'"{key}" is preallocated for {array.shape[0]} repetitions, received '
+                f"{fill_count + data.shape[0]}, reallocating it"
+            )
+            array = self._grow(key, max(fill_count + data.shape[0], 2 * array.shape[0]))
+        array[fill_count : fill_count + data.shape[0]] = data
+        self._fill_counts[key] = fill_count + data.shape[0]
+
+    def _grow(self, key: str, num_rows: int) -> np.memmap:
+        """ Copy the filled repetitions of the result to a file of "num_rows" repetitions """
+        array = self._arrays.pop(key)
+        fill_count = self._fill_counts[key]
+        path = self._array_path(key)
+        tmp_path = path.with_name(path.name + ".tmp")
+        grown = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=array.dtype, shape=(num_rows,) + array.shape[1:]
+        )
+        grown[:fill_count] = array[:fill_count]
+        grown.flush()
+        del array, grown  # the memory maps are closed before the file is replaced
+        os.replace(tmp_path, path)
+        self._arrays[key] = np.load(path, mmap_mode="r+")
+        return self._arrays[key]
+
+    def read(self, key: str, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        start, stop, _ = slice(start, stop).indices(self._fill_counts[key])
+        return np.array(self._arrays[key][start:stop])
+
+    def shape(self, key: str) -> tuple:
+        return (self._fill_counts[key],) + self._arrays[key].shape[1:]
+
+    def keys(self) -> list:
+        return list(self._arrays)
+
+    def flush(self) -> None:
+        if self.mode == "r":
+            return
+        for array in self._arrays.values():
+            array.flush()
+        (self.path / self.INDEX).write_text(json.dumps(self._fill_counts))
+
+    def close(self) -> None:
+        self.flush()
+        self._arrays = {}
+
+
+BACKENDS = {
+    backend.name: backend for backend in (HDF5Backend, ChunkDirectoryBackend, NpyBackend)
+}
+
+
+def create_backend(
+    backend: str, database_path: Union[str, Path], total_count: Optional[int] = None
+) -> StorageBackend:
+    """
+    Create the backend "hdf5", "chunks" or "npy" for the results of the database file,
+    next to it with the same file stem.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend should be one of {tuple(BACKENDS)}, got {backend}")
+    backend_class = BACKENDS[backend]
+    path = os.path.splitext(str(database_path))[0] + backend_class.suffix
+    if backend_class is NpyBackend:
+        return NpyBackend(path, total_count=total_count)
+    return backend_class(path)
+
+
+def open_results(database: h5py.File, mode: str = "r") -> Optional[StorageBackend]:
+    """
+    Open the backend holding the results of the database, for reading or with mode="a"
+    to append to it, or return None if they are stored in the database itself.
+    """
+    if BACKEND_ATTR not in database.attrs:
+        return None
+    record = json.loads(database.attrs[BACKEND_ATTR])
+    path = Path(database.filename).parent / record["path"]
+    if not path.exists():
+        raise FileNotFoundError(
+            f'The {record["name"]} results of {database.filename} are missing at {path}'
+        )
+    return BACKENDS[record["name"]](path, mode=mode)
@@ -0,0 +1,386 @@
+"""
+Catalog of the measurement files of a project, kept in an SQLite file next to the
+"project/YYYYMMDD/HHMMSS_name.h5" tree, so that runs can be searched without opening
+every hdf5 file.
+
+Each file is registered by initialise_database (unless catalog=False) and updated with
+its scalar metadata, dataset shapes and final status when the DataSaver exits.
+
+usage:
+    python -m qcrew.codebase.datasaver.catalog rebuild <project_path>
+    python -m qcrew.codebase.datasaver.catalog query <project_path> --exp T1 --sample sample_B
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Union
+
+import h5py
+import numpy as np
+
+from qcrew.codebase.datasaver.backends import BACKENDS
+from qcrew.codebase.datasaver.hdf5_helper import (
+    JSON_METADATA,
+    SHARD_SUFFIX,
+    read_json_from_hdf5,
+)
+
+log = logging.getLogger(__name__)
+
+CATALOG_FILENAME = "catalog.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    name TEXT,
+    exp_name TEXT,
+    sample_name TEXT,
+    timestamp REAL,
+    status TEXT,
+    mtime REAL
+);
+CREATE TABLE IF NOT EXISTS scalars (
+    path TEXT,
+    key TEXT,
+    value,
+    PRIMARY KEY (path, key)
+);
+CREATE TABLE IF NOT EXISTS datasets (
+    path TEXT,
+    name TEXT,
+    shape TEXT,
+    dtype TEXT,
+    PRIMARY KEY (path, name)
+);
+CREATE INDEX IF NOT EXISTS files_exp_sample_time ON files (exp_name, sample_name, timestamp);
+CREATE INDEX IF NOT EXISTS scalars_key ON scalars (key);
+"""
+
+
+def summarise_datafile(file: h5py.File) -> tuple:
+    """
+    Return the scalar metadata {key: value} at the root of the file and the shapes
+    {dataset path: (shape, dtype)} of all its datasets.
+    """
+    scalars = {}
+    for key, value in file.attrs.items():
+        scalars[key] = value
+    if JSON_METADATA in file:
+        scalars.update(read_json_from_hdf5(file))
+    scalars = {
+        key: _to_sql_scalar(value)
+        for key, value in scalars.items()
+        if _to_sql_scalar(value) is not None
+    }
+
+    datasets = {}
+
+    def visit(name, item):
+        if isinstance(item, h5py.Dataset) and not name.startswith(JSON_METADATA):
+            datasets[name] = (item.shape, str(item.dtype))
+
+    file.visititems(visit)
+    return scalars, datasets
+
+
+def _to_sql_scalar(value):
+    if isinstance(value, (bool, np.bool_)):
+        return int(value)
+    elif isinstance(value, (int, float, str)):
+        return value
+    elif isinstance(value, np.number):
+        return value.item()
+    elif isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return None
+
+
+class Catalog:
+    """
+    SQLite catalog of the hdf5 files of a project.
+
+    Arguments:
+        project_path (str or Path): the project directory, i.e. "datadir / project_name"
+            of DatabaseFile. The catalog is the file "catalog.sqlite" in it.
+
+    example:
+        catalog = Catalog(Path.cwd() / "data" / "sample_B")
+        runs = catalog.query(exp_name="T1", sample_name="sample_B", since="2021-06-01")
+        t1s = catalog.trend("fit_tau", exp_name="T1")
+    """
+
+    def __init__(self, project_path: Union[str, Path]):
+        self.project_path = Path(project_path)
+        self.path = self.project_path / CATALOG_FILENAME
+        self.project_path.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # a connection per call, so that the catalog can be shared by threads and
+        # processes, sqlite serialises the writers
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        try:
+            with connection:  # commit, or rollback on error
+                yield connection
+        finally:
+            connection.close()
+
+    def _relative(self, filepath: Union[str, Path]) -> str:
+        filepath = Path(filepath).resolve()
+        try:
+            return filepath.relative_to(self.project_path.resolve()).as_posix()
+        except ValueError:
+            return filepath.as_posix()
+
+    def register(
+        self,
+        filepath: Union[str, Path],
+        name: str,
+        exp_name: Optional[str] = None,
+        sample_name: Optional[str] = None,
+        timestamp: Optional[float] = None,
+        status: str = "running",
+    ) -> None:
+        """
+        Add a new measurement file to the catalog.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self._relative(filepath),
+                    name,
+                    exp_name,
+                    sample_name,
+                    timestamp,
+                    status,
+                    None,
+                ),
+            )
+
+    def update(
+        self, filepath: Union[str, Path], file: h5py.File, status: Optional[str] = None
+    ) -> None:
+        """
+        Record the scalar metadata and dataset shapes of the open hdf5 "file", and its
+        status if given, e.g. "complete" or "failed".
+        """
+        path = self._relative(filepath)
+        scalars, datasets = summarise_datafile(file)
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE files SET mtime = ? WHERE path = ?",
+                (os.path.getmtime(filepath), path),
+            )
+            if status is not None:
+                connection.execute(
+                    "UPDATE files SET status = ? WHERE path = ?", (status, path)
+                )
+            connection.execute("DELETE FROM scalars WHERE path = ?", (path,))
+            connection.executemany(
+                "INSERT INTO scalars VALUES (?, ?, ?)",
+                [(path, key, value) for key, value in scalars.items()],
+            )
+            connection.execute("DELETE FROM datasets WHERE path = ?", (path,))
+            connection.executemany(
+                "INSERT INTO datasets VALUES (?, ?, ?, ?)",
+                [
+                    (path, name, json.dumps(shape), dtype)
+                    for name, (shape, dtype) in datasets.items()
+                ],
+            )
+
+    def query(
+        self,
+        exp_name: Optional[str] = None,
+        sample_name: Optional[str] = None,
+        since=None,
+        until=None,
+        status: Optional[str] = None,
+        **scalars,
+    ) -> list:
+        """
+        Return the catalog entries matching all the given filters, sorted by time. "since"
+        and "until" are epoch seconds, datetime objects or "YYYY-MM-DD" strings. The
+        extra keyword arguments filter on the scalar metadata, e.g. reps=1000.
+        Each entry is a dictionary with the absolute "filepath", the file columns and the
+        "datasets" shapes.
+        """
+        conditions, values = [], []
+        for column, value in (
+            ("exp_name", exp_name),
+            ("sample_name", sample_name),
+            ("status", status),
+        ):
+            if value is not None:
+                conditions.append(f"files.{column} = ?")
+                values.append(value)
+        if since is not None:
+            conditions.append("files.timestamp >= ?")
+            values.append(_to_epoch(since))
+        if until is not None:
+            conditions.append("files.timestamp < ?")
+            values.append(_to_epoch(until))
+        for key, value in scalars.items():
+            conditions.append(
+                "EXISTS (SELECT 1 FROM scalars WHERE scalars.path = files.path"
+                " AND scalars.key = ? AND scalars.value = ?)"
+            )
+            values.extend((key, _to_sql_scalar(value)))
+
+        sql = "SELECT * FROM files"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY timestamp"
+
+        with self._connect() as connection:
+            rows = [dict(row) for row in connection.execute(sql, values)]
+            for row in rows:
+                row["filepath"] = self.project_path / row["path"]
+                row["datasets"] = {
+                    name: tuple(json.loads(shape))
+                    for name, shape in connection.execute(
+                        "SELECT name, shape FROM datasets WHERE path = ?",
+                        (row["path"],),
+                    )
+                }
+        return rows
+
+    def trend(self, key: str, **filters) -> tuple:
+        """
+        Return the (timestamps, values) numpy arrays of the scalar metadata "key" over the
+        files selected by the "query" filters.
+        """
+        rows = self.query(**filters)
+        paths = [row["path"] for row in rows]
+        with self._connect() as connection:
+            values = dict(
+                connection.execute(
+                    "SELECT path, value FROM scalars WHERE key = ? AND path IN ({})".format(
+                        ",".join("?" * len(paths))
+                    ),
+                    [key] + paths,
+                ).fetchall()
+            )
+        timestamps = [row["timestamp"] for row in rows if row["path"] in values]
+        return np.array(timestamps), np.array([values[path] for path in paths if path in values])
+
+    def rebuild(self) -> int:
+        """
+        Scan the project directory and (re)index every hdf5 file found. The exp/sample names
+        and the status of files already in the catalog are kept. Return the number of files.
+        """
+        with self._connect() as connection:
+            known = {
+                row["path"]: dict(row)
+                for row in connection.execute("SELECT * FROM files")
+            }
+
+        count = 0
+        for filepath in sorted(self.project_path.rglob("*.h5")):
+            if not _is_measurement(filepath.relative_to(self.project_path)):
+                continue
+            path = self._relative(filepath)
+            entry = known.get(path, {})
+            name = entry.get("name") or _name_from_filename(filepath.name)
+            try:
+                with h5py.File(filepath, "r") as file:
+                    self.register(
+                        filepath,
+                        name=name,
+                        exp_name=entry.get("exp_name") or _decode(file.attrs.get("exp_name")),
+                        sample_name=entry.get("sample_name")
+                        or _decode(file.attrs.get("sample_name")),
+                        timestamp=entry.get("timestamp") or _timestamp_from_path(filepath),
+                        status=entry.get("status") or "unknown",
+                    )
+                    self.update(filepath, file)
+            except OSError as err:
+                log.warning(f"Cannot index {filepath}: {err}")
+                continue
+            count += 1
+        return count
+
+
+# shard folders and results backends written next to the measurement files
+SIDECAR_SUFFIXES = (SHARD_SUFFIX,) + tuple(backend.suffix for backend in BACKENDS.values())
+
+
+def _is_measurement(filepath: Path) -> bool:
+    """ The shards and results backend of a measurement are hdf5 files as well """
+    return not any(part.endswith(SIDECAR_SUFFIXES) for part in filepath.parts)
+
+
+def _decode(value):
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return value
+
+
+def _name_from_filename(filename: str) -> str:
+    stem = os.path.splitext(filename)[0]
+    prefix, _, rest = stem.partition("_")
+    return rest if prefix.isdigit() and rest else stem
+
+
+def _timestamp_from_path(filepath: Path) -> float:
+    """
+    Time of a file named "YYYYMMDD/HHMMSS_name.h5", or its modification time.
+    """
+    date, time_mark = filepath.parent.name, filepath.name[:6]
+    try:
+        return time.mktime(time.strptime(date + time_mark, "%Y%m%d%H%M%S"))
+    except ValueError:
+        return filepath.stat().st_mtime
+
+
+def _to_epoch(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        return time.mktime(time.strptime(value, "%Y-%m-%d"))
+    return value.timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measurement catalog of a project")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subparsers.add_parser("rebuild", help="index all the files on disk")
+    rebuild_parser.add_argument("project_path")
+    query_parser = subparsers.add_parser("query", help="list the matching files")
+    query_parser.add_argument("project_path")
+    query_parser.add_argument("--exp")
+    query_parser.add_argument("--sample")
+    query_parser.add_argument("--since", help="YYYY-MM-DD")
+    query_parser.add_argument("--until", help="YYYY-MM-DD")
+    query_parser.add_argument("--status")
+    args = parser.parse_args()
+
+    catalog = Catalog(args.project_path)
+    if args.command == "rebuild":
+        start = time.perf_counter()
+        count = catalog.rebuild()
+        print(f"Indexed {count} files in {time.perf_counter() - start:.1f} s")
+    else:
+        rows = catalog.query(
+            exp_name=args.exp,
+            sample_name=args.sample,
+            since=args.since,
+            until=args.until,
+            status=args.status,
+        )
+        for row in rows:
+            print(f"{time.ctime(row['timestamp'])}  {row['status']:<9}{row['path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,13 +5,26 @@ Wolfgang Pfaff and hdf5_data.py from PycQED module.
 @yifan 
 """
 import os
+import copy
+import glob
+import json
 import time
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import h5py
 import numpy as np
 import logging as log
 from uncertainties import UFloat
+from collections.abc import Mapping
 from pathlib import Path
 from typing import Union, Optional, Dict, List
+from qcrew.codebase.datasaver.backends import (
+    BACKEND_ATTR,
+    StorageBackend,
+    create_backend,
+    open_results,
+)
 import logging
 
 log = logging.getLogger(__name__)
@@ -194,7 +207,132 @@ def write_dict_to_hdf5(
             entry_point.attrs[key] = str(item)
 
 
-def read_dict_from_hdf5(data_dict: dict, entry_point):
+SHARD_SUFFIX = ".shards"  # added to the database file stem to get the shard folder
+
+JSON_METADATA = "__metadata_json__"  # dataset holding the compact metadata blob
+JSON_ARRAYS = "__metadata_arrays__"  # group holding the arrays split out of the blob
+
+
+def _encode_json_item(item, arrays: dict, array_threshold: int):
+    """
+    Convert an item into a json serialisable object. Numeric arrays and lists with at least
+    "array_threshold" elements are put in "arrays" and replaced by a reference.
+    """
+    if isinstance(item, (bool, np.bool_)):
+        return bool(item)
+    elif isinstance(item, (str, int, float)) or item is None:
+        return item
+    elif isinstance(item, (complex, np.complexfloating)):
+        return {"__complex__": [float(item.real), float(item.imag)]}
+    elif isinstance(item, np.number):
+        return item.item()
+    elif isinstance(item, dict):
+        return {
+            str(key): _encode_json_item(value, arrays, array_threshold)
+            for key, value in item.items()
+        }
+    elif isinstance(item, UFloat):
+        return {"nominal_value": item.nominal_value, "std_dev": item.std_dev}
+    elif isinstance(item, (list, np.ndarray)) and _is_numeric_array(item):
+        if np.size(item) >= array_threshold:
+            ref = "array_{}".format(len(arrays))
+            arrays[ref] = np.asarray(item)
+            return {"__dataset__": ref}
+        if isinstance(item, np.ndarray) and item.dtype.kind == "c":
+            values = _encode_json_item(item.tolist(), arrays, array_threshold)
+            return {"__ndarray__": values, "dtype": str(item.dtype)}
+        if isinstance(item, np.ndarray):
+            return {"__ndarray__": item.tolist(), "dtype": str(item.dtype)}
+        return [_encode_json_item(x, arrays, array_threshold) for x in item]
+    elif isinstance(item, tuple):
+        return {
+            "__tuple__": [_encode_json_item(x, arrays, array_threshold) for x in item]
+        }
+    elif isinstance(item, list):
+        return [_encode_json_item(x, arrays, array_threshold) for x in item]
+    else:
+        log.warning(
+            'Type "{}" for "{}" not supported, storing as string'.format(type(item), item)
+        )
+        return str(item)
+
+
+def _is_numeric_array(item) -> bool:
+    if isinstance(item, np.ndarray):
+        return item.dtype.kind in "biufc"
+    return len(item) > 0 and all(
+        isinstance(x, (int, float, np.number)) and not isinstance(x, bool) for x in item
+    )
+
+
+def _decode_json_item(item, arrays):
+    """
+    Inverse of "_encode_json_item", "arrays" maps the references to the split out arrays.
+    """
+    if isinstance(item, dict):
+        if "__dataset__" in item:
+            return arrays[item["__dataset__"]][()]
+        elif "__complex__" in item:
+            return complex(*item["__complex__"])
+        elif "__ndarray__" in item:
+            values = _decode_json_item(item["__ndarray__"], arrays)
+            return np.array(values, dtype=item["dtype"])
+        elif "__tuple__" in item:
+            return tuple(_decode_json_item(x, arrays) for x in item["__tuple__"])
+        return {
+            (int(key) if RepresentsInt(key) else key): _decode_json_item(value, arrays)
+            for key, value in item.items()
+        }
+    elif isinstance(item, list):
+        return [_decode_json_item(x, arrays) for x in item]
+    return item
+
+
+def write_dict_to_json_hdf5(
+    data_dict: dict, entry_point, array_threshold: int = 64, overwrite: bool = False
+):
+    """
+    Compact alternative to "write_dict_to_hdf5": the whole dictionary is serialised as one
+    json string dataset, large numeric arrays and lists being split out as real datasets.
+    A snapshot with thousands of entries is then written as a handful of hdf5 objects.
+    "read_dict_from_hdf5" and "LazyGroup" decode it transparently.
+
+    Arguments:
+        data_dict (dict): dictionary to write to hdf5 file
+        entry_point (hdf5 group.file) : location in the nested hdf5 structure where to write to.
+        array_threshold (int): arrays and numeric lists of at least this many elements are
+            stored as datasets
+        overwrite (bool): whether to replace the existing json metadata, otherwise the
+            top level keys are updated
+    """
+    if JSON_METADATA in entry_point and not overwrite:
+        data_dict = {**read_json_from_hdf5(entry_point), **data_dict}
+
+    arrays = {}
+    blob = json.dumps(_encode_json_item(data_dict, arrays, array_threshold))
+
+    for name in (JSON_METADATA, JSON_ARRAYS):
+        if name in entry_point:
+            del entry_point[name]
+    entry_point.create_dataset(JSON_METADATA, data=blob, dtype=h5py.string_dtype())
+    if arrays:
+        array_group = entry_point.create_group(JSON_ARRAYS)
+        for ref, array in arrays.items():
+            array_group.create_dataset(ref, data=array)
+
+
+def read_json_from_hdf5(entry_point) -> dict:
+    """
+    Read the dictionary written by "write_dict_to_json_hdf5" at the entry point.
+    """
+    blob = entry_point[JSON_METADATA][()]
+    if isinstance(blob, bytes):
+        blob = blob.decode("utf-8")
+    arrays = entry_point[JSON_ARRAYS] if JSON_ARRAYS in entry_point else {}
+    return _decode_json_item(json.loads(blob), arrays)
+
+
+def read_dict_from_hdf5(data_dict: dict, entry_point, arrays_as_lists: bool = False):
     """
     Reads a dictionary from an hdf5 file or group that was written using the
     corresponding "write_dict_to_hdf5" function defined above.
@@ -206,42 +344,26 @@ def read_dict_from_hdf5(data_dict: dict, entry_point):
                 function to add the data to an existing data_dict.
         entry_point  (hdf5 group):
                 hdf5 file or group from which to read.
+        arrays_as_lists (bool):
+                whether to convert the datasets written from lists of numbers back to
+                python lists. By default they are returned as numpy arrays.
     """
     # if 'list_type' not in entry_point.attrs:
     for key, item in entry_point.items():
+        if key == JSON_METADATA:
+            data_dict.update(read_json_from_hdf5(entry_point))
+            continue
+        elif key == JSON_ARRAYS:
+            continue
         if RepresentsInt(key):
             key = int(key)
         if isinstance(item, h5py.Group):
             data_dict[key] = {}
-            data_dict[key] = read_dict_from_hdf5(data_dict[key], item)
+            data_dict[key] = read_dict_from_hdf5(data_dict[key], item, arrays_as_lists)
         else:  # item either a group or a dataset
-            if "list_type" not in item.attrs:
-                data_dict[key] = item[()]  # changed deprecated item.value => item[()]
-            elif item.attrs["list_type"] == "str":
-                # lists of strings needs some special care, see also
-                # the writing part in the writing function above.
-                list_of_str = [
-                    x[0] for x in item[()]
-                ]  # changed deprecated item.value => item[()]
-                data_dict[key] = list_of_str
-            elif item.attrs["list_type"] == "array":
-                data_dict[key] = list(
-                    item[()]
-                )  # changed deprecated item.value => item[()]
-            else:
-                data_dict[key] = list(
-                    item[()]
-                )  # changed deprecated item.value => item[()]
+            data_dict[key] = _read_dataset(item, arrays_as_lists)
     for key, item in entry_point.attrs.items():
-        if isinstance(item, str):
-            # Extracts "None" as an exception as h5py does not support
-            # storing None, nested if statement to avoid elementwise
-            # comparison warning
-            if item == "NoneType:__None__":
-                item = None
-            elif item == "NoneType:__emptylist__":
-                item = []
-        data_dict[key] = item
+        data_dict[key] = _decode_attr(item)
 
     if "list_type" in entry_point.attrs:
         if (
@@ -264,6 +386,116 @@ def read_dict_from_hdf5(data_dict: dict, entry_point):
     return data_dict
 
 
+def _read_dataset(item: h5py.Dataset, arrays_as_lists: bool = False):
+    """
+    Read a dataset written by "write_dict_to_hdf5".
+    """
+    if "list_type" not in item.attrs:
+        return item[()]  # changed deprecated item.value => item[()]
+    elif item.attrs["list_type"] == "str":
+        # lists of strings needs some special care, see also
+        # the writing part in the writing function above.
+        return [x[0] for x in item[()]]
+    elif item.attrs["list_type"] == "array":
+        if arrays_as_lists:
+            return list(item[()])
+        return item[()]
+    else:
+        return list(item[()])
+
+
+def _decode_attr(item):
+    if isinstance(item, str):
+        # Extracts "None" as an exception as h5py does not support
+        # storing None, nested if statement to avoid elementwise
+        # comparison warning
+        if item == "NoneType:__None__":
+            item = None
+        elif item == "NoneType:__emptylist__":
+            item = []
+    return item
+
+
+class LazyGroup(Mapping):
+    """
+    Read-only mapping view of an hdf5 file or group written by "write_dict_to_hdf5", which
+    reads nothing until it is indexed. Subgroups are returned as LazyGroup and datasets as
+    h5py datasets, so only the indexed slice is loaded, e.g. view["data"]["I"][-10:].
+    Attributes and lists of strings are small and are returned decoded; lists and tuples
+    stored as groups are read eagerly. The view is valid as long as the file is open.
+
+    Arguments:
+        entry_point (hdf5 group): hdf5 file or group to view
+        arrays_as_lists (bool): return the datasets written from lists of numbers as
+            python lists, which loads them
+    """
+
+    def __init__(self, entry_point, arrays_as_lists: bool = False):
+        self._entry_point = entry_point
+        self._arrays_as_lists = arrays_as_lists
+        self._json_metadata = None
+
+    def _get_json_metadata(self) -> dict:
+        """
+        The compact json metadata is decoded at once when it is first needed.
+        """
+        if self._json_metadata is None:
+            if JSON_METADATA in self._entry_point:
+                self._json_metadata = read_json_from_hdf5(self._entry_point)
+            else:
+                self._json_metadata = {}
+        return self._json_metadata
+
+    def __repr__(self):
+        return f"LazyGroup({self._entry_point.name}, keys={list(self)})"
+
+    def __getitem__(self, key):
+        str_key = str(key)
+        if str_key in self._entry_point.attrs:
+            return _decode_attr(self._entry_point.attrs[str_key])
+        if str_key in (JSON_METADATA, JSON_ARRAYS) or str_key not in self._entry_point:
+            if JSON_METADATA in self._entry_point:
+                json_metadata = self._get_json_metadata()
+                if key in json_metadata:
+                    return json_metadata[key]
+            raise KeyError(key)
+
+        item = self._entry_point[str_key]
+        if isinstance(item, h5py.Group):
+            if "list_type" in item.attrs:
+                return read_dict_from_hdf5({}, item, self._arrays_as_lists)
+            return LazyGroup(item, self._arrays_as_lists)
+        if "list_type" not in item.attrs:
+            return item
+        if item.attrs["list_type"] == "array" and not self._arrays_as_lists:
+            return item
+        return _read_dataset(item, self._arrays_as_lists)
+
+    def _keys(self) -> list:
+        keys = [
+            key
+            for key in self._entry_point.keys()
+            if key not in (JSON_METADATA, JSON_ARRAYS)
+        ]
+        keys += [key for key in self._entry_point.attrs.keys() if key not in keys]
+        keys = [int(key) if RepresentsInt(key) else key for key in keys]
+        if JSON_METADATA in self._entry_point:
+            keys += [key for key in self._get_json_metadata() if key not in keys]
+        return keys
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    def load(self) -> dict:
+        """
+        Read the whole view into a dictionary, as read_dict_from_hdf5 does.
+        """
+        return read_dict_from_hdf5({}, self._entry_point, self._arrays_as_lists)
+
+
 def extract_pars_from_datafile(
     param_spec: dict, filepath: str = None, entry_point=None
 ) -> dict:
@@ -297,71 +529,217 @@ def extract_pars_from_datafile(
             dictionary containing the extracted parameters.
     """
     if filepath is not None:
-        param_dict = {}
-        f = h5py.File(filepath, "r")
         with h5py.File(filepath, "r") as f:
-            for par_name, par_spec in param_spec.items():
-                try:
-                    entry = f[par_spec[0]]
-
-                    if par_spec[1].startswith("dset"):
-                        param_dict[par_name] = entry[
-                            ()
-                        ]  # deprecated syntax: entry.value
-                    elif par_spec[1].startswith("attr:all_attr"):
-                        param_dict[par_name] = dict()
-                        for attribute_name in entry.attrs.keys():
-                            param_dict[par_name][attribute_name] = entry.attrs[
-                                attribute_name
-                            ]
-                    elif par_spec[1].startswith("attr"):
-                        param_dict[par_name] = entry.attrs[par_spec[1][5:]]
-                    elif par_spec[1].startswith("group"):
-                        # This should allow to retrieve the entire tree under a certain
-                        # as a dictionary
-                        new_dict = dict()
-                        param_dict[par_name] = read_dict_from_hdf5(
-                            new_dict, entry_point=entry
-                        )
-                    else:
-                        raise ValueError(
-                            "Parameter spec `{}` not recognized".format(par_spec[1])
-                        )
-                except Exception as err:
-                    raise err
+            param_dict = _extract_pars(param_spec, f)
 
     elif (filepath is None) and (entry_point is not None):
-        param_dict = {}
-        for par_name, par_spec in param_spec.items():
+        param_dict = _extract_pars(param_spec, entry_point)
+
+    return param_dict
+
+
+def _extract_pars(param_spec: dict, f) -> dict:
+    param_dict = {}
+    for par_name, par_spec in param_spec.items():
+        entry = f[par_spec[0]]
+
+        if par_spec[1].startswith("dset"):
+            param_dict[par_name] = entry[()]  # deprecated syntax: entry.value
+        elif par_spec[1].startswith("attr:all_attr"):
+            param_dict[par_name] = dict()
+            for attribute_name in entry.attrs.keys():
+                param_dict[par_name][attribute_name] = entry.attrs[attribute_name]
+        elif par_spec[1].startswith("attr"):
+            param_dict[par_name] = entry.attrs[par_spec[1][5:]]
+        elif par_spec[1].startswith("group"):
+            # This should allow to retrieve the entire tree under a certain
+            # as a dictionary
+            new_dict = dict()
+            param_dict[par_name] = read_dict_from_hdf5(new_dict, entry_point=entry)
+        else:
+            raise ValueError("Parameter spec `{}` not recognized".format(par_spec[1]))
+    return param_dict
+
+
+EXTRACT_CACHE = "extract_cache.json"  # in the user cache directory, see _user_cache_dir
+EXTRACT_CACHE_ENTRIES = 20000  # maximum number of (file, param_spec) entries kept
+EXTRACT_CACHE_ENTRY_BYTES = 4096  # larger parameters, e.g. raw data, are not cached
+
+
+def _extract_pars_from_file(args: tuple) -> dict:
+    """ Process pool worker of extract_pars_from_datafiles """
+    param_spec, filepath = args
+    return extract_pars_from_datafile(param_spec, filepath=filepath)
+
+
+def extract_pars_from_datafiles(
+    param_spec: dict,
+    filepaths: Union[str, List[Union[str, Path]]],
+    processes: Optional[int] = None,
+    use_cache: bool = True,
+    skip_errors: bool = False,
+    cache_path: Optional[Union[str, Path]] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Batched "extract_pars_from_datafile": extract the same parameters from many hdf5
+    datafiles with a process pool, e.g. for T1/T2 drift reports.
+
+    Arguments:
+        param_spec (dict): specification of parameters to extract, see
+            extract_pars_from_datafile
+        filepaths (str or list): list of filepaths, or a glob pattern such as
+            "data/sample_B/2021*/*_T1.h5" ("**" is recursive)
+        processes (int): number of worker processes, by default the number of CPUs.
+            processes=1 extracts in the current process
+        use_cache (bool): reuse the parameters extracted earlier, in this session or a
+            previous one, from files whose modification time and size have not changed.
+            Only small parameters are cached, e.g. fit results and attributes, not the
+            raw datasets, and the oldest entries are dropped past EXTRACT_CACHE_ENTRIES
+        skip_errors (bool): leave out, with a warning, the files which cannot be read
+            or miss a parameter, instead of raising
+        cache_path (str or Path): json file keeping the extracted parameters between
+            sessions, by default "extract_cache.json" in the user cache directory
+
+    Return:
+        columns (dict)
+            "filepath": array of the filepaths, then for each parameter name the array
+            of its values in the same order. Values of the same shape are stacked into
+            one numeric array, otherwise an object array is returned.
+    """
+    if isinstance(filepaths, (str, Path)):
+        filepaths = sorted(glob.glob(str(filepaths), recursive=True))
+    filepaths = [os.path.abspath(filepath) for filepath in filepaths]
+    spec_key = json.dumps(param_spec, sort_keys=True)
+    cache = {}
+    if use_cache and filepaths:
+        if cache_path is None:
+            cache_path = os.path.join(_user_cache_dir(), EXTRACT_CACHE)
+        cache = _load_extract_cache(cache_path)
+
+    results, to_extract, extracted = {}, [], {}
+    for filepath in filepaths:
+        try:
+            stat = os.stat(filepath)
+        except OSError as err:
+            if not skip_errors:
+                raise
+            log.warning(f"Cannot extract parameters from {filepath}: {err}")
+            continue
+        cached = cache.get(json.dumps([filepath, spec_key]))
+        if cached and (cached["mtime_ns"], cached["size"]) == (
+            stat.st_mtime_ns,
+            stat.st_size,
+        ):
+            results[filepath] = _decode_json_item(cached["params"], {})
+        else:
+            to_extract.append((filepath, stat))
+
+    def store(filepath, stat, param_dict):
+        results[filepath] = param_dict
+        if any(
+            np.size(value) * 8 > EXTRACT_CACHE_ENTRY_BYTES for value in param_dict.values()
+        ):
+            return  # raw data, not worth encoding
+        params = _encode_json_item(param_dict, {}, array_threshold=np.inf)
+        if len(json.dumps(params)) <= EXTRACT_CACHE_ENTRY_BYTES:
+            extracted[json.dumps([filepath, spec_key])] = {
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "params": params,
+            }
+
+    if processes == 1 or len(to_extract) <= 1:
+        for filepath, stat in to_extract:
             try:
-                f = entry_point
-                entry = f[par_spec[0]]
-
-                if par_spec[1].startswith("dset"):
-                    param_dict[par_name] = entry[()]  # deprecated syntax: entry.value
-                elif par_spec[1].startswith("attr:all_attr"):
-                    param_dict[par_name] = dict()
-                    for attribute_name in entry.attrs.keys():
-                        param_dict[par_name][attribute_name] = entry.attrs[
-                            attribute_name
-                        ]
-                elif par_spec[1].startswith("attr"):
-                    param_dict[par_name] = entry.attrs[par_spec[1][5:]]
-                elif par_spec[1].startswith("group"):
-                    # This should allow to retrieve the entire tree under a certain
-                    # as a dictionary
-                    new_dict = dict()
-                    param_dict[par_name] = read_dict_from_hdf5(
-                        new_dict, entry_point=entry
-                    )
-                else:
-                    raise ValueError(
-                        "Parameter spec `{}` not recognized".format(par_spec[1])
-                    )
+                store(filepath, stat, extract_pars_from_datafile(param_spec, filepath))
             except Exception as err:
-                raise err
+                if not skip_errors:
+                    raise
+                log.warning(f"Cannot extract parameters from {filepath}: {err}")
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = {
+                executor.submit(_extract_pars_from_file, (param_spec, filepath)): (
+                    filepath,
+                    stat,
+                )
+                for filepath, stat in to_extract
+            }
+            for future in as_completed(futures):
+                filepath, stat = futures[future]
+                try:
+                    store(filepath, stat, future.result())
+                except Exception as err:
+                    if not skip_errors:
+                        raise
+                    log.warning(f"Cannot extract parameters from {filepath}: {err}")
+
+    if use_cache and extracted:
+        # merged with the file as it is now, another report may have updated it, the
+        # new entries go last and the oldest ones are dropped
+        cache = _load_extract_cache(cache_path)
+        for key in extracted:
+            cache.pop(key, None)
+        cache.update(extracted)
+        entries = list(cache.items())[-EXTRACT_CACHE_ENTRIES:]
+        _save_extract_cache(cache_path, dict(entries))
+
+    filepaths = [filepath for filepath in filepaths if filepath in results]
+    columns = {"filepath": np.array(filepaths, dtype=str)}
+    for par_name in param_spec:
+        columns[par_name] = _to_column([results[path][par_name] for path in filepaths])
+    return columns
+
+
+def _user_cache_dir() -> str:
+    """ Per user cache directory of qcrew, e.g. ~/.cache/qcrew """
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(base, "qcrew")
+
+
+def _load_extract_cache(cache_path: Union[str, Path]) -> dict:
+    """ Read the extract cache file, an unreadable cache is ignored """
+    try:
+        with open(cache_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except Exception as err:
+        log.warning(f"Ignoring the extract cache {cache_path}: {err}")
+        return {}
+
+
+def _save_extract_cache(cache_path: Union[str, Path], cache: dict) -> None:
+    """ Replace the extract cache file in one step, a failure only costs the cache """
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(cache, file)
+        os.replace(tmp_path, cache_path)
+    except OSError as err:
+        log.warning(f"Cannot write the extract cache {cache_path}: {err}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
-    return param_dict
+
+def _to_column(values: list) -> np.ndarray:
+    """
+    Stack the values into one array if they share their shape, otherwise return an
+    object array of the values.
+    """
+    try:
+        shapes = {np.shape(value) for value in values}
+        if len(shapes) <= 1 and not any(isinstance(value, dict) for value in values):
+            return np.array(values)
+    except ValueError:
+        pass
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
 
 
 ########################################
@@ -370,8 +748,17 @@ def extract_pars_from_datafile(
 class DateTimeGenerator(object):
     """
     Class to generate filenames / directories based on the date and time.
+
+    The new time subdirectories and time tagged files are reserved with an exclusive
+    create, so that several processes creating files at the same time never get the same
+    name. If the name is taken, a sequence suffix is added: "HHMMSS_name.h5",
+    "HHMMSS_name_1.h5", ... Without the time tag, the file is "name.h5" whether it exists
+    or not, and the new data is appended to it (see tests/test_filenames.py).
     """
 
+    # maximum number of names tried before giving up
+    max_attempts = 1000
+
     def __init__(self, timesubdir: bool = False, timefilename: bool = False):
         """
         Arguments:
@@ -381,6 +768,22 @@ class DateTimeGenerator(object):
         self.timesubdir = timesubdir
         self.timefilename = timefilename
 
+    def _reserve(self, path: str, create, suffix: str = "") -> str:
+        """
+        Create "path + suffix" with the exclusive "create" function (os.mkdir or an
+        exclusive file open), or the first free "path_N + suffix". Return the created path.
+        """
+        for counter in range(self.max_attempts):
+            candidate = path if counter == 0 else f"{path}_{counter}"
+            try:
+                create(candidate + suffix)
+                return candidate + suffix
+            except FileExistsError:
+                continue
+        raise FileExistsError(
+            f"No free name for {path + suffix} after {self.max_attempts} attempts"
+        )
+
     def create_data_dir(
         self,
         datadir: str,
@@ -409,43 +812,23 @@ class DateTimeGenerator(object):
             ts = time.localtime()
         if datesubdir:
             path = os.path.join(path, time.strftime("%Y%m%d", ts))
+        os.makedirs(path, exist_ok=True)
 
         if timesubdir or self.timesubdir:
             tsd = time.strftime("%H%M%S", ts)
-            timestamp_verified = False
-            counter = 0
-
-            # Verify if timestamp is unique by seeing if the folder exists
-            while not timestamp_verified:
-                counter += 1
-                try:
-                    measdirs = [d for d in os.listdir(path) if d[:6] == tsd]
-                    if len(measdirs) == 0:
-                        timestamp_verified = True
-                    else:
-                        # if timestamp not unique, add one second
-                        # This is quite a hack
-                        ts = time.localtime((time.mktime(ts) + 1))
-                        tsd = time.strftime("%H%M%S", ts)
-                    if counter >= 3600:
-                        raise Exception()
-                except OSError as err:
-                    if "cannot find the path specified" in str(err):
-                        timestamp_verified = True
-                    elif "No such file or directory" in str(err):
-                        timestamp_verified = True
-                    else:
-                        raise err
             if name is not None:
                 path = os.path.join(path, tsd + "_" + name)
             else:
                 path = os.path.join(path, tsd)
+            path = self._reserve(path, os.mkdir)
 
         return path
 
     def new_filename(self, data_obj, path):
         """
-        Return a new filename, based on name and timestamp.
+        Return a new filename, based on name and timestamp. A time tagged file is created
+        empty, so that no other process can take the name. Otherwise "name.h5" is
+        returned as it is, to append to the existing file.
 
         Arugments:
             data_obj (hdf5.File) : the hdf5 datafile object
@@ -464,36 +847,16 @@ class DateTimeGenerator(object):
                 ts = time.localtime()
 
             tsd = time.strftime("%H%M%S", ts)
-            timestamp_verified = False
-            counter = 0
+            filename = "%s_%s" % (tsd, data_obj._name)
+        else:
+            return os.path.join(path, "%s.h5" % (data_obj._name))
 
-            # Verify if timestamp is unique by seeing if the folder exists
-            while not timestamp_verified:
-                counter += 1
-                try:
-                    measdirs = [d for d in os.listdir(path) if d[:6] == tsd]
-                    if len(measdirs) == 0:
-                        timestamp_verified = True
-                    else:
-                        # if timestamp not unique, add one second
-                        # This is quite a hack
-                        ts = time.localtime((time.mktime(ts) + 1))
-                        tsd = time.strftime("%H%M%S", ts)
-                    if counter >= 3600:
-                        raise Exception()
-                except OSError as err:
-                    if "cannot find the path specified" in str(err):
-                        timestamp_verified = True
-                    elif "No such file or directory" in str(err):
-                        timestamp_verified = True
-                    else:
-                        raise err
+        return self._reserve(os.path.join(path, filename), _create_file, ".h5")
 
-            filename = "%s_%s.h5" % (tsd, data_obj._name)
-        else:
-            filename = "%s.h5" % (data_obj._name)
 
-        return os.path.join(path, filename)
+def _create_file(filepath: str) -> None:
+    """ Create an empty file, raise FileExistsError if it exists """
+    os.close(os.open(filepath, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
 
 
 class DatabaseFile(h5py.File):
@@ -508,6 +871,7 @@ class DatabaseFile(h5py.File):
         datadir: str,
         timesubdir: bool = False,
         timefilename: bool = True,
+        swmr: bool = False,
     ):
         """
         Creates an empty data set including the file, for which the currently
@@ -517,7 +881,10 @@ class DatabaseFile(h5py.File):
             name (str) : base name of the file
             datadir (str) : A base path where the hdf5file will be created in its subdirectory
                 using the standard timestamp structure
+            swmr (bool) : open the file with the latest file format, so that it can be
+                switched to single-writer/multiple-reader mode by DataHandle.start_swmr()
         """
+        self.swmr = swmr
         self._timesubdir = timesubdir
         self._timefilename = timefilename
         self._name = name
@@ -534,9 +901,13 @@ class DatabaseFile(h5py.File):
         ).new_filename(self, path=self._datapath)
         self.folder, self._filename = os.path.split(self.filepath)
 
-        if not os.path.isdir(self.folder):
-            os.makedirs(self.folder)
-        super(DatabaseFile, self).__init__(self.filepath, "a")
+        # the file name generator has reserved a time tagged file by creating it empty,
+        # a file named without the time tag is appended to
+        mode = "w" if timefilename is True else "a"
+        if swmr:
+            super(DatabaseFile, self).__init__(self.filepath, mode, libver="latest")
+        else:
+            super(DatabaseFile, self).__init__(self.filepath, mode)
         self.flush()
 
 
@@ -547,9 +918,17 @@ def initialise_database(
     path: Union[str, Path],
     timesubdir: bool = False,
     timefilename: bool = True,
+    swmr: bool = False,
+    catalog: bool = True,
 ) -> Path:
     """initialise the database in the date folder under the given main path.
     return the database hdf5 object
+
+    If swmr is True, the file can be read by other processes while it is written, see
+    DataHandle.start_swmr() and SWMRReader.
+    The file is registered in the project catalog (see datasaver/catalog.py), and its
+    metadata and status are recorded when the DataSaver exits. A catalog that cannot be
+    written is logged and does not stop the measurement, pass catalog=False to skip it.
     """
 
     name = sample_name + "_" + exp_name
@@ -559,41 +938,529 @@ def initialise_database(
         datadir=path,
         timesubdir=timesubdir,
         timefilename=timefilename,
+        swmr=swmr,
     )
 
+    if catalog:
+        from qcrew.codebase.datasaver.catalog import Catalog
+
+        database.attrs["exp_name"] = exp_name
+        database.attrs["sample_name"] = sample_name
+        try:
+            database.catalog = Catalog(database._datapath)
+            database.catalog.register(
+                database.filepath,
+                name=name,
+                exp_name=exp_name,
+                sample_name=sample_name,
+                timestamp=time.mktime(database._localtime),
+            )
+        except Exception:
+            log.exception("Cannot register the file in the measurement catalog")
+            database.catalog = None
+
     db_path = Path(database.filename)
     log.info("Create and initialise the database at {db_path}")
     return database
 
 
+class StoragePolicy:
+    """
+    Chunk geometry, filters and dtype of the datasets created by a DataHandle.
+
+    Arguments:
+        chunks (bool, int or tuple): True for h5py automatic chunking, an int for the
+            number of repetitions per chunk (the chunk spans the whole sweep), or the
+            full chunk shape as a tuple
+        compression (str): hdf5 compression filter, e.g. "lzf" or "gzip"
+        compression_opts (int): option of the filter, e.g. the gzip level 0-9
+        shuffle (bool): whether to apply the byte shuffle filter before compression
+        dtype (str or np.dtype): dtype the data is stored with, e.g. "float32"
+
+    example:
+        storage = StoragePolicy(chunks=256, compression="gzip", compression_opts=4, shuffle=True)
+    """
+
+    def __init__(
+        self,
+        chunks: Union[bool, int, tuple] = True,
+        compression: Optional[str] = None,
+        compression_opts: Optional[int] = None,
+        shuffle: bool = False,
+        dtype=None,
+    ):
+        self.chunks = chunks
+        self.compression = compression
+        self.compression_opts = compression_opts
+        self.shuffle = shuffle
+        self.dtype = np.dtype(dtype) if dtype is not None else None
+
+    def __repr__(self):
+        return f"StoragePolicy({self.to_dict()})"
+
+    def to_dict(self) -> dict:
+        return {
+            "chunks": self.chunks,
+            "compression": self.compression,
+            "compression_opts": self.compression_opts,
+            "shuffle": self.shuffle,
+            "dtype": str(self.dtype) if self.dtype is not None else None,
+        }
+
+    def dataset_kwargs(self, shape: tuple, fixed: bool = False) -> dict:
+        """
+        Return the h5py create_dataset keyword arguments for a dataset of the given shape,
+        the first dimension being the repetition number. A "fixed" size dataset cannot
+        have chunks larger than itself, so the chunk shape is clamped to its shape.
+        """
+        if isinstance(self.chunks, bool):
+            chunks = self.chunks
+        elif isinstance(self.chunks, int):
+            chunks = (self.chunks,) + tuple(shape[1:])
+        else:
+            chunks = tuple(self.chunks)
+
+        if fixed and isinstance(chunks, tuple):
+            if len(chunks) != len(shape):
+                chunks = True  # the chunk shape is meant for other results
+            else:
+                chunks = tuple(min(c, s) for c, s in zip(chunks, shape))
+
+        kwargs = {"chunks": chunks, "shuffle": self.shuffle}
+        if self.compression is not None:
+            kwargs["compression"] = self.compression
+            kwargs["compression_opts"] = self.compression_opts
+        return kwargs
+
+    def cast(self, data: np.ndarray) -> np.ndarray:
+        if self.dtype is None:
+            return data
+        return data.astype(self.dtype, copy=False)
+
+    def record(self, dataset: h5py.Dataset) -> None:
+        """
+        Record the policy in the attributes of the dataset.
+        """
+        dataset.attrs["storage_policy"] = json.dumps(self.to_dict())
+
+
+class FlushPolicy:
+    """
+    Decide when a DataHandle flushes the hdf5 file to disk. Flushing after every call
+    keeps the file readable after a crash, while flushing rarely gives more throughput.
+
+    Arguments:
+        mode (str):
+            "always": flush after every DataHandle write call
+            "interval": flush when "seconds" have passed since the last flush
+            "bytes": flush when "nbytes" have been written since the last flush
+            "exit": only flush on DataHandle.checkpoint() and when the DataSaver exits
+        seconds (float): flush interval for the "interval" mode
+        nbytes (int): flush size for the "bytes" mode
+
+    example:
+        DataSaver(db, flush_policy=FlushPolicy("interval", seconds=10))
+    """
+
+    MODES = ("always", "interval", "bytes", "exit")
+
+    def __init__(
+        self, mode: str = "always", seconds: Optional[float] = None, nbytes: int = None
+    ):
+        if mode not in self.MODES:
+            raise ValueError(f"Flush mode should be one of {self.MODES}, got {mode}")
+        if mode == "interval" and seconds is None:
+            raise ValueError('The "interval" flush mode needs "seconds"')
+        if mode == "bytes" and nbytes is None:
+            raise ValueError('The "bytes" flush mode needs "nbytes"')
+
+        self.mode = mode
+        self.seconds = seconds
+        self.nbytes = nbytes
+        self.reset()
+
+    def __repr__(self):
+        return f"FlushPolicy(mode={self.mode}, seconds={self.seconds}, nbytes={self.nbytes})"
+
+    def reset(self) -> None:
+        """
+        To be called after each flush.
+        """
+        self._last_flush = time.monotonic()
+        self._pending_bytes = 0
+
+    def record(self, nbytes: int) -> bool:
+        """
+        Record a write call of "nbytes" bytes, return whether the file should be flushed.
+        """
+        self._pending_bytes += nbytes
+        if self.mode == "always":
+            return True
+        elif self.mode == "interval":
+            return time.monotonic() - self._last_flush >= self.seconds
+        elif self.mode == "bytes":
+            return self._pending_bytes >= self.nbytes
+        return False
+
+
+class AsyncWriter:
+    """
+    Run hdf5 write calls in submission order on a dedicated writer thread, so that the
+    live measurement loop never waits on disk I/O.
+
+    The queue is bounded: once "max_queue" writes are pending, submit() blocks until the
+    writer catches up (backpressure), or raises TimeoutError after "put_timeout" seconds.
+    An exception raised on the writer thread is kept and re-raised as a RuntimeError on the
+    next submit(), join() or close() call. Writes queued after a failure are discarded.
+    """
+
+    _STOP = object()
+
+    def __init__(self, max_queue: int = 16, put_timeout: Optional[float] = None):
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._put_timeout = put_timeout
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._run, name="DataSaverWriter", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is self._STOP:
+                    return
+                if self._error is None:
+                    func, args, kwargs = item
+                    func(*args, **kwargs)
+            except Exception as err:
+                log.exception("The datasaver writer thread failed")
+                self._error = err
+            finally:
+                self._queue.task_done()
+
+    def raise_error(self) -> None:
+        if self._error is not None:
+            raise RuntimeError(
+                "The datasaver writer thread failed, the pending data is not saved"
+            ) from self._error
+
+    def submit(self, func, *args, **kwargs) -> None:
+        """
+        Queue "func(*args, **kwargs)" to be run on the writer thread.
+        """
+        self.raise_error()
+        try:
+            self._queue.put((func, args, kwargs), timeout=self._put_timeout)
+        except queue.Full:
+            raise TimeoutError(
+                f"The datasaver write queue is still full after {self._put_timeout} s"
+            )
+
+    def join(self) -> None:
+        """
+        Block until all the queued writes are done.
+        """
+        self._queue.join()
+        self.raise_error()
+
+    def close(self) -> None:
+        """
+        Drain the queue and stop the writer thread.
+        """
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+        self.raise_error()
+
+
 class DataSaver:
-    def __init__(self, database: h5py.File) -> None:
+    def __init__(
+        self,
+        database: h5py.File,
+        async_write: bool = False,
+        max_queue: int = 16,
+        total_count: Optional[int] = None,
+        storage: Optional[StoragePolicy] = None,
+        tag_storage: Optional[Dict[str, StoragePolicy]] = None,
+        flush_policy: Optional[FlushPolicy] = None,
+        finalise: Optional[str] = None,
+        finalise_storage: Optional[StoragePolicy] = None,
+        preview_levels: tuple = (),
+        aggregate: tuple = (),
+        iq_pair: Optional[tuple] = ("I", "Q"),
+        shard_bytes: Optional[int] = None,
+        shard_seconds: Optional[float] = None,
+        backend: Optional[Union[str, StorageBackend]] = None,
+    ) -> None:
+        """
+        Arguments:
+            database (h5py.File): the hdf5 file to write into
+            async_write (bool): if True, the data is written by a background writer
+                thread and the DataHandle methods return as soon as the data is queued
+            max_queue (int): maximum number of pending writes in async mode before the
+                caller is blocked
+            total_count (int): total number of repetitions of the run, e.g.
+                Fetcher.total_count. If given, the datasets updated by
+                DataHandle.update_result are preallocated at their final shape
+            storage (StoragePolicy): chunking, compression and dtype of the result datasets
+            tag_storage (dict): storage policy per result name, e.g. {"I": policy},
+                overrides "storage" for the given names
+            flush_policy (FlushPolicy): when the file is flushed during the run, by default
+                after every write call. The file is always flushed on exit
+            finalise (str): if given, the grown datasets are rewritten with this layout,
+                "contiguous" or "chunked", once the file is closed (see datasaver/repack.py)
+            finalise_storage (StoragePolicy): compression and chunks used by the finalise
+                step, by default "storage". The contiguous layout cannot be compressed, it
+                only keeps the dtype of "storage"
+            preview_levels (tuple): block sizes, e.g. (10, 100, 1000), of the preview
+                datasets "<group>/preview/<name>/<block>" kept next to each updated result.
+                Each row is the average of a block of repetitions, see read_preview
+            aggregate (tuple): names of the results, e.g. ("I", "Q"), for which only the per
+                sweep point sum, sum of squares and count are stored in
+                "<group>/aggregate/<name>", instead of the raw repetitions. See read_aggregate
+            iq_pair (tuple): if both results are aggregated, the sum of their product is
+                stored as well in "<group>/aggregate/I_Q", for the I/Q covariance
+            shard_bytes (int), shard_seconds (float): if any is given, the updated results
+                are written in shard files "<name>.shards/shardNNN.h5" next to the database,
+                rolled over once the shard holds "shard_bytes" of data or is
+                "shard_seconds" old. The database keeps the metadata and exposes each
+                result as a virtual dataset spanning the closed shards, the closed shards
+                can be copied or archived while the run goes on
+            backend (str or StorageBackend): optional sidecar store of the updated
+                results, which are by default datasets of the database. "hdf5", "chunks"
+                (a chunk directory) or "npy" (memory mapped .npy files, needs
+                "total_count") create the store next to the database with the storage
+                policy of each result, see datasaver/backends.py. The metadata, the added
+                results, previews and aggregates stay in the database whatever the backend.
+                A reopened database appends to the store it records
+        """
         self.db = database
+        self.async_write = async_write
+        self.max_queue = max_queue
+        self.total_count = total_count
+        self.storage = storage
+        self.tag_storage = tag_storage
+        self.flush_policy = flush_policy
+        self.finalise = finalise
+        self.finalise_storage = self._check_finalise(finalise, finalise_storage, storage)
+        self.preview_levels = preview_levels
+        self.aggregate = aggregate
+        self.iq_pair = iq_pair
+        self.shard_bytes = shard_bytes
+        self.shard_seconds = shard_seconds
+        self.backend = backend
+        self._writer = None
+        self._handle = None
+
+    @staticmethod
+    def _check_finalise(finalise, finalise_storage, storage) -> Optional[StoragePolicy]:
+        """ Fail before the run, not when the file is repacked on exit """
+        if finalise is None:
+            return finalise_storage
+        if finalise not in ("contiguous", "chunked"):
+            raise ValueError(f"finalise should be 'contiguous' or 'chunked', got {finalise}")
+        if finalise != "contiguous":
+            return finalise_storage
+        if finalise_storage is not None:
+            if finalise_storage.compression is not None:
+                raise ValueError("Compressed datasets need the chunked finalise layout")
+            return finalise_storage
+        if storage is not None and storage.compression is not None:
+            # the run storage is compressed, the contiguous copy only keeps its dtype
+            return StoragePolicy(dtype=storage.dtype)
+        return None
 
     def __enter__(self) -> None:
         # check if the hdf5 file is open or not
         if not self.db.__bool__():
             self.db = h5py.File(self.db.filename, "a")
 
-        return DataHandle(database=self.db)
+        if self.async_write:
+            self._writer = AsyncWriter(max_queue=self.max_queue)
+
+        self._handle = DataHandle(
+            database=self.db,
+            writer=self._writer,
+            total_count=self.total_count,
+            storage=self.storage,
+            tag_storage=self.tag_storage,
+            flush_policy=self.flush_policy,
+            preview_levels=self.preview_levels,
+            aggregate=self.aggregate,
+            iq_pair=self.iq_pair,
+            shard_bytes=self.shard_bytes,
+            shard_seconds=self.shard_seconds,
+            backend=self._open_backend(),
+        )
+        return self._handle
+
+    def _open_backend(self) -> Optional[StorageBackend]:
+        if BACKEND_ATTR in self.db.attrs and not isinstance(self.backend, StorageBackend):
+            # a reopened database appends to the store of its previous sessions
+            recorded = json.loads(self.db.attrs[BACKEND_ATTR])["name"]
+            if self.backend is not None and self.backend != recorded:
+                raise ValueError(
+                    f"The results of {self.db.filename} are in the {recorded} backend, "
+                    f"cannot continue them in the {self.backend} backend"
+                )
+            return open_results(self.db, mode="a")
+        if self.backend is None:
+            return None
+        if isinstance(self.backend, str):
+            backend = create_backend(self.backend, self.db.filename, self.total_count)
+        else:
+            backend = self.backend
+        # the database records where its results are, for open_results
+        self.db.attrs[BACKEND_ATTR] = json.dumps(
+            {
+                "name": backend.name,
+                "path": os.path.relpath(backend.path, os.path.dirname(self.db.filename)),
+            }
+        )
+        return backend
 
     def __exit__(self, type, value, traceback) -> None:
-        self.db.flush()
-        self.db.close()
-        print("The database hdf5 file is closed")
+        status = "failed" if type is not None else "complete"
+        filepath = self.db.filename
+        try:
+            try:
+                # all the queued data must reach the file before it is closed
+                if self._writer is not None:
+                    try:
+                        self._writer.close()
+                    except RuntimeError:
+                        status = "failed"
+                        # the writer error is already logged, do not mask the original one
+                        if type is None:
+                            raise
+                    finally:
+                        self._writer = None
+            finally:
+                try:
+                    # even if the writer failed, so that the data already written is left
+                    # without padding and exposed by the virtual datasets
+                    self._handle._finish()
+                finally:
+                    if self._handle.backend is not None:
+                        self._handle.backend.close()
+                    self.db.flush()
+                    self.db.close()
+                    print("The database hdf5 file is closed")
+
+            if self.finalise is not None and status == "complete":
+                from qcrew.codebase.datasaver.repack import repack_datafile
+
+                repack_datafile(
+                    filepath,
+                    layout=self.finalise,
+                    storage=self.finalise_storage or self.storage,
+                )
+        finally:
+            # the catalog records the file as it is left, after the finalise step
+            self._update_catalog(filepath, status)
+
+    def _update_catalog(self, filepath: str, status: str) -> None:
+        catalog = getattr(self.db, "catalog", None)
+        if catalog is None:
+            return
+        try:
+            with h5py.File(filepath, "r") as file:
+                catalog.update(filepath, file, status=status)
+        except Exception:
+            log.exception("Cannot update the measurement catalog")
 
 
 class DataHandle:
-    def __init__(self, database: h5py.File):
+    def __init__(
+        self,
+        database: h5py.File,
+        writer: Optional[AsyncWriter] = None,
+        total_count: Optional[int] = None,
+        storage: Optional[StoragePolicy] = None,
+        tag_storage: Optional[Dict[str, StoragePolicy]] = None,
+        flush_policy: Optional[FlushPolicy] = None,
+        preview_levels: tuple = (),
+        aggregate: tuple = (),
+        iq_pair: Optional[tuple] = ("I", "Q"),
+        shard_bytes: Optional[int] = None,
+        shard_seconds: Optional[float] = None,
+        backend: Optional[StorageBackend] = None,
+    ):
         self.db = database
+        self._writer = writer
+        self.total_count = total_count
+        self.storage = storage or StoragePolicy()
+        self.tag_storage = tag_storage or {}
+        self.flush_policy = flush_policy or FlushPolicy()
+        self._fill_counts = {}  # preallocated dataset name -> number of filled rows
+        self.preview_levels = tuple(sorted(preview_levels))
+        # (group, name, block) -> (sum, count) of the repetitions of the unfinished block
+        self._preview_pending = {}
+        self.aggregate = tuple(aggregate)
+        self.iq_pair = (
+            tuple(iq_pair)
+            if iq_pair is not None and all(name in self.aggregate for name in iq_pair)
+            else None
+        )
+        self._aggregates = {}  # (group, name) -> in-memory accumulators
+        # group -> iq pair name -> batches not yet matched by the other member
+        self._iq_pending = {}
+        self.shard_bytes = shard_bytes
+        self.shard_seconds = shard_seconds
+        if (shard_bytes is not None or shard_seconds is not None) and getattr(
+            database, "swmr", False
+        ):
+            raise ValueError("The sharded mode cannot be used with SWMR")
+        self._shard = None  # current shard file
+        self._shard_paths = []
+        self._shard_opened = None
+        self._shard_bytes_written = 0
+        # dataset path -> [(shard file name, shape, dtype)] of the closed shards
+        self._shard_sources = {}
+        if shard_bytes is not None or shard_seconds is not None:
+            self._resume_shards()
+        self.backend = backend
+        if backend is not None and (
+            shard_bytes is not None
+            or shard_seconds is not None
+            or getattr(database, "swmr", False)
+        ):
+            raise ValueError("A results backend cannot be used with shards or SWMR")
+
+    def _dispatch(self, func, *args, **kwargs) -> None:
+        """
+        Run the write call directly, or queue it on the writer thread in async mode.
+        """
+        if self._writer is not None:
+            self._writer.submit(func, *args, **kwargs)
+        else:
+            func(*args, **kwargs)
 
     def update_result(self, name: str, data: np.ndarray, group: Optional[str]) -> None:
+        # copy the data in async mode, the caller is free to reuse its buffer
+        if self._writer is not None:
+            data = np.array(data)
+        self._dispatch(self._update_multiple_results, {name: data}, group)
+
+    def _update_result(self, name: str, data: np.ndarray, group: Optional[str]) -> None:
+
+        if self.backend is not None:
+            data = self._append_to_backend(name, data, group)
+            if self.preview_levels:
+                preview_point = self.db.require_group(group) if group else self.db
+                self._update_preview(preview_point, name, data)
+            return
+
+        # the raw results go to the current shard file in sharded mode
+        data_file = self._get_data_file()
 
         # if group is given, it will create a group in the hdf5 file
         if group:
-            enter_point = self.db.require_group(group)
+            enter_point = data_file.require_group(group)
         else:
-            enter_point = self.db
+            enter_point = data_file
 
         if name in enter_point.keys():
             dataset = enter_point[name]
@@ -623,8 +1490,7 @@ class DataHandle:
                         )
 
                     # resize the existing data shape and update data
-                    dataset.resize(dataset.shape[0] + data.shape[0], axis=0)
-                    dataset[-data.shape[0] :] = data
+                    self._append_result(dataset, data)
 
                 # 3d raw data
                 # the first index is the repetition number
@@ -641,8 +1507,13 @@ class DataHandle:
                         )
 
                     # resize the existing data shape and update data
-                    dataset.resize(dataset.shape[0] + data.shape[0], axis=0)
-                    dataset[-data.shape[0] :] = data
+                    self._append_result(dataset, data)
+
+                # higher dimensional raw data, e.g. (reps, qu_a, rr_a, rr_f) buffers
+                elif (len(new_data_shape) == len(exist_data_shape) > 3) and (
+                    new_data_shape[1:] == exist_data_shape[1:]
+                ):
+                    self._append_result(dataset, data)
 
                 else:
                     raise ValueError(
@@ -654,6 +1525,10 @@ class DataHandle:
                 raise TypeError("The write position is not a hdf5 dataset")
 
         # there is no existing data named by the given name
+        elif self.db.swmr_mode:
+            raise ValueError(
+                f'There is no dataset "{name}", in SWMR mode the results must be declared before start_swmr()'
+            )
         else:
 
             if isinstance(data, list):
@@ -673,32 +1548,417 @@ class DataHandle:
                 # create new max shape, in first dimension, it is unlimited
                 newdata_shape_list[0] = None
                 maxshape = tuple(newdata_shape_list)
-                enter_point.create_dataset(
-                    name=name, data=data, maxshape=maxshape, chunks=True
-                )
+                self._create_result(enter_point, name, data, maxshape)
             else:
                 data_shape_list = list(new_data_shape)
                 data_shape_list[0] = None
                 maxshape = tuple(data_shape_list)
-                enter_point.create_dataset(
-                    name=name, data=data, maxshape=maxshape, chunks=True
+                self._create_result(enter_point, name, data, maxshape)
+
+        if self.shard_bytes is not None or self.shard_seconds is not None:
+            self._shard_bytes_written += data.nbytes
+
+        if self.preview_levels:
+            preview_point = self.db.require_group(group) if group else self.db
+            self._update_preview(preview_point, name, data)
+
+    def _append_to_backend(
+        self, name: str, data: np.ndarray, group: Optional[str]
+    ) -> np.ndarray:
+        """
+        Append the repetitions to the result "<group>/<name>" of the backend, a 1d array
+        being one repetition. Return the data as appended.
+        """
+        data = np.asarray(data)
+        if data.ndim == 1:
+            data = data.reshape((1,) + data.shape)
+        storage = self._get_storage(name)
+        data = storage.cast(data)
+        key = f"{group}/{name}" if group else name
+        self.backend.append(key, data, storage=storage)
+        return data
+
+    def _require_preview(
+        self, enter_point, name: str, block: int, shape: tuple
+    ) -> h5py.Dataset:
+        """
+        Return the preview dataset of "name" averaged over blocks of "block" repetitions,
+        "shape" being the shape of one repetition.
+        """
+        preview_group = enter_point.require_group("preview").require_group(name)
+        key = str(block)
+        if key not in preview_group:
+            dataset = preview_group.create_dataset(
+                key, shape=(0,) + shape, maxshape=(None,) + shape, dtype="float64", chunks=True
+            )
+            dataset.attrs["block"] = block
+        return preview_group[key]
+
+    def _update_preview(self, enter_point, name: str, data: np.ndarray) -> None:
+        """
+        Append the averages of the blocks of repetitions completed by this batch to the
+        preview datasets, the repetitions of an unfinished block are kept in memory.
+        """
+        sweep_shape = data.shape[1:]
+        for block in self.preview_levels:
+            key = (enter_point.name, name, block)
+            if key in self._preview_pending:
+                block_sum, block_count = self._preview_pending[key]
+            else:
+                block_sum, block_count = self._resume_preview(
+                    enter_point, name, block, sweep_shape
                 )
 
-        # flush data to the file once update new data
+            # complete the pending block first
+            take = min(block - block_count, data.shape[0])
+            block_sum = block_sum + data[:take].sum(axis=0)
+            block_count += take
+            rows = []
+            if block_count == block:
+                rows.append(block_sum / block)
+                block_sum, block_count = np.zeros(sweep_shape), 0
+
+            rest = data[take:]
+            num_blocks = rest.shape[0] // block
+            if num_blocks:
+                blocks = rest[: num_blocks * block].reshape((num_blocks, block) + sweep_shape)
+                rows.extend(blocks.mean(axis=1))
+            remainder = rest[num_blocks * block :]
+            if remainder.shape[0]:
+                block_sum, block_count = remainder.sum(axis=0), remainder.shape[0]
+            self._preview_pending[key] = (block_sum, block_count)
+
+            if rows:
+                dataset = self._require_preview(enter_point, name, block, sweep_shape)
+                dataset.resize(dataset.shape[0] + len(rows), axis=0)
+                dataset[-len(rows) :] = np.array(rows)
+
+    def _resume_preview(self, enter_point, name: str, block: int, shape: tuple) -> tuple:
+        """
+        Return the (sum, count) of the unfinished block to continue: the partial last row
+        flushed by a previous session is taken back out of the preview, if any.
+        """
+        dataset = enter_point.get(f"preview/{name}/{block}")
+        if dataset is None or "last_block" not in dataset.attrs:
+            return np.zeros(shape), 0
+        block_count = int(dataset.attrs["last_block"])
+        block_sum = dataset[-1] * block_count
+        dataset.resize(dataset.shape[0] - 1, axis=0)
+        del dataset.attrs["last_block"]
+        return block_sum, block_count
+
+    def _flush_previews(self) -> None:
+        """
+        Append the unfinished block of each preview as a last, smaller row, its number of
+        repetitions being recorded in the "last_block" attribute of the preview.
+        """
+        for (group_name, name, block), (block_sum, block_count) in list(
+            self._preview_pending.items()
+        ):
+            if not block_count:
+                continue
+            dataset = self._require_preview(
+                self.db[group_name], name, block, block_sum.shape
+            )
+            dataset.resize(dataset.shape[0] + 1, axis=0)
+            dataset[-1] = block_sum / block_count
+            dataset.attrs["last_block"] = block_count
+        self._preview_pending = {}
+
+    def _require_aggregate(self, group: Optional[str], name: str, shape: tuple) -> dict:
+        """
+        Return the accumulator datasets {"sum": ..., "sum_sq": ..., "count": ...} of the
+        result "name", "shape" being the shape of one repetition.
+        """
+        if group:
+            enter_point = self.db.require_group(group)
+        else:
+            enter_point = self.db
+        aggregate_group = enter_point.require_group("aggregate").require_group(name)
+        return {
+            key: aggregate_group.require_dataset(
+                key, shape=shape, dtype="int64" if key == "count" else "float64"
+            )
+            for key in ("sum", "sum_sq", "count")
+        }
+
+    def _update_aggregate(self, name: str, data: np.ndarray, group: Optional[str]) -> None:
+        """
+        Add a batch of repetitions to the per sweep point sum, sum of squares and count of
+        the result "name", instead of saving the raw data.
+        """
+        data = np.asarray(data, dtype="float64")
+        if data.ndim == 1:
+            data = data.reshape((1,) + data.shape)
+        key = (group, name)
+        if key not in self._aggregates:
+            # continue from the sums already in the file, e.g. of a previous session
+            datasets = self._require_aggregate(group, name, data.shape[1:])
+            self._aggregates[key] = {
+                field: dataset[...] for field, dataset in datasets.items()
+            }
+        accumulators = self._aggregates[key]
+        if data.shape[1:] != accumulators["sum"].shape:
+            raise ValueError(
+                f"The received new data have the shape {data.shape}, while the aggregate \
+                of {name} has the sweep shape {accumulators['sum'].shape}."
+            )
+        accumulators["sum"] += data.sum(axis=0)
+        accumulators["sum_sq"] += np.square(data).sum(axis=0)
+        accumulators["count"] += data.shape[0]
+
+        datasets = self._require_aggregate(group, name, data.shape[1:])
+        for field, dataset in datasets.items():
+            dataset[...] = accumulators[field]
+
+    def _pair_iq(self, data_dict: dict, group: Optional[str]) -> None:
+        """
+        Buffer the repetitions of the iq pair until both I and Q have arrived, so the
+        cross term also accumulates when they are updated in separate calls.
+        """
+        pending = self._iq_pending.setdefault(
+            group, {name: [] for name in self.iq_pair}
+        )
+        for name in self.iq_pair:
+            if name in data_dict:
+                data = np.asarray(data_dict[name], dtype="float64")
+                pending[name].append(data[np.newaxis] if data.ndim == 1 else data)
+        num_paired = min(
+            sum(batch.shape[0] for batch in pending[name]) for name in self.iq_pair
+        )
+        if not num_paired:
+            return
+        paired = {}
+        for name in self.iq_pair:
+            rows = np.concatenate(pending[name])
+            paired[name] = rows[:num_paired]
+            pending[name] = [rows[num_paired:]] if rows.shape[0] > num_paired else []
+        self._update_cross_aggregate(paired, group)
+
+    def _update_cross_aggregate(self, data_dict: dict, group: Optional[str]) -> None:
+        """
+        Accumulate the I*Q cross term of the iq pair, for their covariance.
+        """
+        i_name, q_name = self.iq_pair
+        i_data = np.asarray(data_dict[i_name], dtype="float64")
+        q_data = np.asarray(data_dict[q_name], dtype="float64")
+        if i_data.ndim == 1:
+            i_data, q_data = i_data[np.newaxis], q_data[np.newaxis]
+        key = (group, i_name + "_" + q_name)
+        if group:
+            enter_point = self.db.require_group(group)
+        else:
+            enter_point = self.db
+        cross_group = enter_point.require_group("aggregate").require_group(key[1])
+        datasets = {
+            field: cross_group.require_dataset(
+                field,
+                shape=i_data.shape[1:],
+                dtype="int64" if field == "count" else "float64",
+            )
+            for field in ("sum_prod", "count")
+        }
+        if key not in self._aggregates:
+            # continue from the sums already in the file, e.g. of a previous session
+            self._aggregates[key] = {
+                field: dataset[...] for field, dataset in datasets.items()
+            }
+        accumulators = self._aggregates[key]
+        accumulators["sum_prod"] += (i_data * q_data).sum(axis=0)
+        accumulators["count"] += i_data.shape[0]
+
+        for field, dataset in datasets.items():
+            dataset[...] = accumulators[field]
+
+    def declare_result(
+        self, name: str, shape: tuple, dtype="float64", group: Optional[str] = None
+    ) -> None:
+        """
+        Create an empty result dataset of "shape" per repetition, to be grown by
+        update_result. In SWMR mode no dataset can be created once the readers are
+        allowed in, so all the updated results have to be declared before start_swmr().
+        """
+        self._dispatch(self._declare_result, name, tuple(shape), dtype, group)
+
+    def _declare_result(
+        self, name: str, shape: tuple, dtype, group: Optional[str]
+    ) -> None:
+        if name in self.aggregate:
+            self._require_aggregate(group, name, shape)
+            if self.iq_pair is not None and name == self.iq_pair[1]:
+                cross_name = "_".join(self.iq_pair)
+                enter_point = self.db.require_group(group) if group else self.db
+                cross_group = enter_point.require_group("aggregate").require_group(cross_name)
+                cross_group.require_dataset("sum_prod", shape=shape, dtype="float64")
+                cross_group.require_dataset("count", shape=shape, dtype="int64")
+            return
+
+        if group:
+            enter_point = self.db.require_group(group)
+        else:
+            enter_point = self.db
+
+        storage = self._get_storage(name)
+        dtype = storage.dtype if storage.dtype is not None else np.dtype(dtype)
+        full_shape = (0,) + shape
+        dataset = enter_point.create_dataset(
+            name=name,
+            shape=full_shape,
+            dtype=dtype,
+            maxshape=(None,) + shape,
+            **storage.dataset_kwargs(full_shape),
+        )
+        storage.record(dataset)
+        for block in self.preview_levels:
+            self._require_preview(enter_point, name, block, shape)
+
+    def start_swmr(self) -> None:
+        """
+        Switch the file to single-writer/multiple-reader mode, from then on other processes
+        can follow the data with SWMRReader. The metadata and all the result datasets must
+        be written or declared before, as no new object or attribute can be created in
+        SWMR mode. The results are then grown by resizing, without preallocation.
+        """
+        self._dispatch(self._start_swmr)
+
+    def _start_swmr(self) -> None:
+        if not getattr(self.db, "swmr", False):
+            raise ValueError(
+                'The SWMR mode needs a database initialised with "swmr = True"'
+            )
         self.db.flush()
+        self.db.swmr_mode = True
+
+    def _create_result(self, enter_point, name: str, data: np.ndarray, maxshape: tuple):
+        """
+        Create the dataset of a result. If the total repetition number is known, the
+        dataset is preallocated at its final shape (total_count, sweep...) and the number
+        of filled repetitions is kept in the "fill_count" attribute.
+        """
+        storage = self._get_storage(name)
+        data = storage.cast(data)
+
+        # SWMR readers follow the dataset shape, and shards only hold part of the
+        # repetitions, so the dataset is grown instead
+        preallocate = (
+            self.total_count is not None
+            and not getattr(self.db, "swmr", False)
+            and self.shard_bytes is None
+            and self.shard_seconds is None
+        )
+        if not preallocate or data.shape[0] >= self.total_count:
+            dataset = enter_point.create_dataset(
+                name=name,
+                data=data,
+                maxshape=maxshape,
+                **storage.dataset_kwargs(data.shape),
+            )
+            storage.record(dataset)
+            return
+
+        shape = (self.total_count,) + data.shape[1:]
+        dataset = enter_point.create_dataset(
+            name=name,
+            shape=shape,
+            dtype=data.dtype,
+            maxshape=maxshape,
+            **storage.dataset_kwargs(shape),
+        )
+        storage.record(dataset)
+        dataset[: data.shape[0]] = data
+        dataset.attrs["fill_count"] = data.shape[0]
+        self._fill_counts[dataset.name] = data.shape[0]
+
+    def _append_result(self, dataset: h5py.Dataset, data: np.ndarray) -> None:
+        """
+        Write the new repetitions after the filled region of the dataset, the dataset is
+        only resized when the preallocated rows are used up.
+        """
+        if dataset.name not in self._fill_counts and "fill_count" in dataset.attrs:
+            # preallocated by a previous session which did not trim it, e.g. a crash
+            self._fill_counts[dataset.name] = int(dataset.attrs["fill_count"])
+        if dataset.name not in self._fill_counts:
+            dataset.resize(dataset.shape[0] + data.shape[0], axis=0)
+            dataset[-data.shape[0] :] = data
+            return
+
+        fill_count = self._fill_counts[dataset.name]
+        new_fill_count = fill_count + data.shape[0]
+        if new_fill_count > dataset.shape[0]:
+            # more results than expected
+            dataset.resize(new_fill_count, axis=0)
+        dataset[fill_count:new_fill_count] = data
+        dataset.attrs["fill_count"] = new_fill_count
+        self._fill_counts[dataset.name] = new_fill_count
+
+    def _finish(self) -> None:
+        """
+        Trim the preallocated results, flush the previews and close the last shard. Each
+        step is done even if an earlier one fails, the first error is raised at the end.
+        """
+        errors = []
+        steps = (
+            self._trim_results, self._flush_previews, self._warn_unpaired, self._close_shard
+        )
+        for step in steps:
+            try:
+                step()
+            except Exception as err:
+                log.exception(f"DataHandle.{step.__name__} failed")
+                errors.append(err)
+        if errors:
+            raise errors[0]
+
+    def _warn_unpaired(self) -> None:
+        """
+        Warn about the repetitions of I or Q whose partner never arrived, they are left
+        out of the I_Q cross term.
+        """
+        for group, pending in self._iq_pending.items():
+            for name, batches in pending.items():
+                num_rows = sum(batch.shape[0] for batch in batches)
+                if num_rows:
+                    log.warning(
+                        f"{num_rows} repetitions of {name} in group {group} have no "
+                        f"matching {' or '.join(set(self.iq_pair) - {name})}, they are "
+                        "left out of the I_Q covariance"
+                    )
+
+    def _trim_results(self) -> None:
+        """
+        Cut the unfilled rows of the preallocated datasets, e.g. if the run is stopped
+        before all the repetitions are done.
+        """
+        for dataset_name, fill_count in self._fill_counts.items():
+            dataset = self.db[dataset_name]
+            if dataset.shape[0] > fill_count:
+                dataset.resize(fill_count, axis=0)
 
     def update_multiple_results(
         self, data_dict: Dict[str, np.ndarray], group=Optional[str], save = Optional[List[str]]
     ) -> None:
-        
+
         if save:
-            for i, (key, value) in enumerate(data_dict.items()):
-                if key in save:
-                    self.update_result(name=key, data=value, group=group)
-        else: 
-            for i, (key, value) in enumerate(data_dict.items()):
-                self.update_result(name=key, data=value, group=group)
-        self.db.flush()
+            data_dict = {key: value for key, value in data_dict.items() if key in save}
+        # copy the data in async mode, the caller is free to reuse its buffers
+        if self._writer is not None:
+            data_dict = {key: np.array(value) for key, value in data_dict.items()}
+        self._dispatch(self._update_multiple_results, data_dict, group)
+
+    def _update_multiple_results(
+        self, data_dict: Dict[str, np.ndarray], group: Optional[str]
+    ) -> None:
+        for key, value in data_dict.items():
+            if key in self.aggregate:
+                self._update_aggregate(name=key, data=value, group=group)
+            else:
+                self._update_result(name=key, data=value, group=group)
+        if self.iq_pair is not None and any(key in data_dict for key in self.iq_pair):
+            self._pair_iq(data_dict, group)
+        # flush data to the file according to the flush policy
+        self._written(sum(np.asarray(value).nbytes for value in data_dict.values()))
+        if self._shard_is_full():
+            self._close_shard()
 
     def add_result(
         self, name: str, data: np.ndarray, overwirte: bool = False, group=Optional[str]
@@ -706,7 +1966,13 @@ class DataHandle:
         """
         add the result once, rather than update the data
         """
+        if self._writer is not None:
+            data = np.array(data)
+        self._dispatch(self._add_result, name, data, overwirte, group)
 
+    def _add_result(
+        self, name: str, data: np.ndarray, overwirte: bool, group: Optional[str]
+    ) -> None:
         # if group is given, it will create a group in the hdf5 file
         if group:
             enter_point = self.db.require_group(group)
@@ -717,7 +1983,7 @@ class DataHandle:
             if isinstance(enter_point[name], h5py.Dataset):
                 if overwirte:
                     del enter_point[name]
-                    enter_point.create_dataset(name=name, data=data)
+                    self._create_dataset(enter_point, name, data)
                     log.info("Delete the exisitng data and overwrite it")
                 else:
                     log.warning(
@@ -734,9 +2000,29 @@ class DataHandle:
                 )
 
         else:
+            self._create_dataset(enter_point, name, data)
+
+        self._written(np.asarray(data).nbytes)
+
+    def _create_dataset(self, enter_point, name: str, data) -> None:
+        """
+        Create a fixed size dataset with the storage policy of the given name. Scalars,
+        empty arrays and strings cannot be chunked, they are stored as they are.
+        """
+        data = np.asarray(data)
+        if data.ndim == 0 or data.size == 0 or data.dtype.kind in "OSU":
             enter_point.create_dataset(name=name, data=data)
+            return
 
-        self.db.flush()
+        storage = self._get_storage(name)
+        data = storage.cast(data)
+        dataset = enter_point.create_dataset(
+            name=name, data=data, **storage.dataset_kwargs(data.shape, fixed=True)
+        )
+        storage.record(dataset)
+
+    def _get_storage(self, name: str) -> StoragePolicy:
+        return self.tag_storage.get(name, self.storage)
 
     def add_multiple_results(
         self, data_dict: dict, overwrite: bool = False, group=Optional[str], save = Optional[List[str]]
@@ -754,18 +2040,302 @@ class DataHandle:
             for i, (key, value) in enumerate(data_dict.items()):
                 self.add_result(name=key, data=value, overwirte=overwrite, group=group)
 
-    def add_metadata(self, metadata_dict: dict, overwrite: bool = False) -> None:
+    def add_metadata(
+        self, metadata_dict: dict, overwrite: bool = False, encoding: str = "groups"
+    ) -> None:
+        """
+        Write the metadata dictionary in the file. With encoding "groups", the
+        dictionary is mapped on hdf5 groups and attributes; with encoding "json", it is
+        serialised as one compact json blob, which is much faster for large snapshots
+        such as Stage.parameters. Both are read back by get_metadata.
+        """
+        if encoding not in ("groups", "json"):
+            raise ValueError(f'Metadata encoding should be "groups" or "json", got {encoding}')
+        if encoding == "json":
+            if self._writer is not None:
+                metadata_dict = copy.deepcopy(metadata_dict)
+            self._dispatch(self._add_json_metadata, metadata_dict, overwrite)
+            return
+
         if overwrite:
             overwirte_level = 0
         else:
             overwirte_level = np.inf
+        if self._writer is not None:
+            metadata_dict = copy.deepcopy(metadata_dict)
+        self._dispatch(self._add_metadata, metadata_dict, overwirte_level)
+
+    def _add_metadata(self, metadata_dict: dict, overwirte_level) -> None:
         write_dict_to_hdf5(metadata_dict, self.db, overwirte_level)
+        self._written(0)
+
+    def _add_json_metadata(self, metadata_dict: dict, overwrite: bool) -> None:
+        write_dict_to_json_hdf5(metadata_dict, self.db, overwrite=overwrite)
+        self._written(0)
 
-    def get_metadata(self, read_dict: dict) -> None:
-        get_dict = read_dict_from_hdf5(read_dict, self.db)
+    def _written(self, nbytes: int) -> None:
+        """
+        Flush the file if the flush policy asks for it after a write call of "nbytes".
+        """
+        if self.flush_policy.record(nbytes):
+            self.db.flush()
+            if self._shard is not None:
+                self._shard.flush()
+            if self.backend is not None:
+                self.backend.flush()
+            self.flush_policy.reset()
+
+    def checkpoint(self) -> None:
+        """
+        Make everything written so far durable: wait for the queued writes (async mode)
+        and flush the file, whatever the flush policy.
+        """
+        if self._writer is not None:
+            self._writer.join()
+        self.db.flush()
+        if self._shard is not None:
+            self._shard.flush()
+        if self.backend is not None:
+            self.backend.flush()
+        self.flush_policy.reset()
+
+    def _get_data_file(self) -> h5py.File:
+        """
+        Return the file the raw results are written in: the database itself, or in sharded
+        mode the current shard file, which is opened if needed.
+        """
+        if self.shard_bytes is None and self.shard_seconds is None:
+            return self.db
+        if self._shard is None:
+            # the shards are kept apart, so that they are not taken for measurements
+            shard_dir = os.path.splitext(self.db.filename)[0] + SHARD_SUFFIX
+            os.makedirs(shard_dir, exist_ok=True)
+            # an existing shard, e.g. of a previous session, is never overwritten
+            index = len(self._shard_paths)
+            while True:
+                shard_path = os.path.join(shard_dir, f"shard{index:03d}.h5")
+                try:
+                    self._shard = h5py.File(shard_path, "x")
+                    break
+                except FileExistsError:
+                    index += 1
+            self._shard_paths.append(shard_path)
+            self._shard_opened = time.monotonic()
+            self._shard_bytes_written = 0
+        return self._shard
+
+    def _resume_shards(self) -> None:
+        """
+        Continue the virtual datasets of a reopened database: the shards of the previous
+        sessions stay in front of the ones written now.
+        """
+        folder = os.path.dirname(os.path.abspath(self.db.filename))
+
+        def resume(path, item):
+            if not (isinstance(item, h5py.Dataset) and item.is_virtual):
+                return
+            if "shards" not in item.attrs:
+                return
+            for source in item.virtual_sources():
+                shard_name = source.file_name
+                start, stop = source.vspace.get_select_bounds()
+                shape = (stop[0] - start[0] + 1,) + item.shape[1:]
+                self._shard_sources.setdefault("/" + path, []).append(
+                    (shard_name, shape, item.dtype)
+                )
+                shard_path = os.path.join(folder, shard_name)
+                if shard_path not in self._shard_paths:
+                    self._shard_paths.append(shard_path)
+
+        self.db.visititems(resume)
+
+    def _shard_is_full(self) -> bool:
+        if self._shard is None:
+            return False
+        if self.shard_bytes is not None and self._shard_bytes_written >= self.shard_bytes:
+            return True
+        if self.shard_seconds is not None:
+            return time.monotonic() - self._shard_opened >= self.shard_seconds
+        return False
+
+    def _close_shard(self) -> None:
+        """
+        Close the current shard file, so that it can be copied or archived, and update the
+        virtual datasets of the database to include it. The next update opens a new shard.
+        """
+        if self._shard is None:
+            return
+        # relative to the database folder, where the virtual datasets look for it
+        shard_name = os.path.relpath(
+            self._shard.filename, os.path.dirname(os.path.abspath(self.db.filename))
+        )
+
+        def record(path, item):
+            if isinstance(item, h5py.Dataset) and item.shape[0] > 0:
+                self._shard_sources.setdefault("/" + path, []).append(
+                    (shard_name, item.shape, item.dtype)
+                )
+
+        self._shard.visititems(record)
+        self._shard.close()
+        self._shard = None
+        self._build_virtual_datasets()
+
+    def _build_virtual_datasets(self) -> None:
+        """
+        Expose each sharded result as one virtual dataset of the database, stacking its
+        shards along the repetitions. The shard files are referenced relative to the
+        database, so the database and its ".shards" folder have to be moved together.
+        """
+        for path, sources in self._shard_sources.items():
+            sweep_shape, dtype = sources[0][1][1:], sources[0][2]
+            num_rows = sum(shape[0] for _, shape, _ in sources)
+            layout = h5py.VirtualLayout(shape=(num_rows,) + sweep_shape, dtype=dtype)
+            start = 0
+            for shard_name, shape, _ in sources:
+                layout[start : start + shape[0]] = h5py.VirtualSource(
+                    shard_name, path, shape=shape
+                )
+                start += shape[0]
+
+            if path in self.db:
+                del self.db[path]
+            group_path, name = path.rsplit("/", 1)
+            dataset = self.db.require_group(group_path or "/").create_virtual_dataset(
+                name, layout
+            )
+            dataset.attrs["shards"] = [shard_name for shard_name, _, _ in sources]
+        self.db.flush()
+
+    def get_metadata(
+        self, read_dict: dict, lazy: bool = False, arrays_as_lists: bool = False
+    ) -> None:
+        """
+        Read back the content of the file. If lazy is True, return a LazyGroup view which
+        only reads what is indexed, "read_dict" is then not used.
+        """
+        # the pending writes must land before reading back
+        if self._writer is not None:
+            self._writer.join()
+        if lazy:
+            return LazyGroup(self.db, arrays_as_lists)
+        get_dict = read_dict_from_hdf5(read_dict, self.db, arrays_as_lists)
         return get_dict
 
 
+def read_preview(entry_point, name: str, max_rows: int = 1000) -> tuple:
+    """
+    Read the finest preview of the result "name" in the group "entry_point" which has at
+    most "max_rows" rows, e.g. read_preview(file["data"], "I") to look at the convergence
+    of a long run without loading the raw data.
+
+    Return:
+        (data, block): the block averages and the number of repetitions per row. The last
+        row of a closed run may average fewer repetitions, the number given by the
+        "last_block" attribute of the preview dataset
+    """
+    if "preview" not in entry_point or name not in entry_point["preview"]:
+        raise KeyError(f'There is no preview of "{name}" in {entry_point.name}')
+    levels = sorted(entry_point["preview"][name].values(), key=lambda d: d.attrs["block"])
+    for dataset in levels:
+        if dataset.shape[0] <= max_rows:
+            return dataset[()], int(dataset.attrs["block"])
+    # even the coarsest level is too long, return its last rows
+    dataset = levels[-1]
+    return dataset[-max_rows:], int(dataset.attrs["block"])
+
+
+def read_aggregate(entry_point, name: str) -> dict:
+    """
+    Read the statistics of a result stored with DataSaver(aggregate=...) in the group
+    "entry_point", e.g. read_aggregate(file["data"], "I").
+
+    Return:
+        dict with the per sweep point "count", "mean", "variance" (unbiased) and
+        "std_err" of the mean
+    """
+    aggregate_group = entry_point["aggregate"][name]
+    count = aggregate_group["count"][()]
+    total = aggregate_group["sum"][()]
+    mean = total / count
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variance = (aggregate_group["sum_sq"][()] - total * mean) / (count - 1)
+    variance = np.maximum(variance, 0)  # rounding errors
+    return {
+        "count": count,
+        "mean": mean,
+        "variance": variance,
+        "std_err": np.sqrt(variance / count),
+    }
+
+
+def read_aggregate_covariance(entry_point, i_name: str = "I", q_name: str = "Q"):
+    """
+    Return the per sweep point (unbiased) covariance of the aggregated results "i_name"
+    and "q_name" stored with DataSaver(aggregate=..., iq_pair=(i_name, q_name)).
+    """
+    aggregate_group = entry_point["aggregate"]
+    cross_group = aggregate_group[i_name + "_" + q_name]
+    count = cross_group["count"][()]
+    i_mean = aggregate_group[i_name]["sum"][()] / count
+    q_sum = aggregate_group[q_name]["sum"][()]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (cross_group["sum_prod"][()] - i_mean * q_sum) / (count - 1)
+
+
+class SWMRReader:
+    """
+    Follow the growing datasets of a file written in SWMR mode (see DataHandle.start_swmr)
+    from another process, without reopening the file.
+
+    example:
+        with SWMRReader(filepath) as reader:
+            for new_data in reader.follow("data/I", "data/Q", interval=2):
+                print(new_data["data/I"].shape)
+    """
+
+    def __init__(self, filepath: Union[str, Path]):
+        self.file = h5py.File(filepath, "r", libver="latest", swmr=True)
+        self._read_counts = {}  # dataset name -> number of rows already returned
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.file.close()
+
+    def read_new(self, name: str) -> np.ndarray:
+        """
+        Return the rows of the dataset "name" written since the last call.
+        """
+        dataset = self.file[name]
+        dataset.refresh()
+        start = self._read_counts.get(name, 0)
+        stop = dataset.shape[0]
+        self._read_counts[name] = stop
+        return dataset[start:stop]
+
+    def follow(
+        self, *names: str, interval: float = 1.0, timeout: Optional[float] = None
+    ):
+        """
+        Generator of {name: new rows} dictionaries, yielded whenever at least one of the
+        datasets has grown. It stops once no data arrived for "timeout" seconds.
+        """
+        last_update = time.monotonic()
+        while True:
+            new_data = {name: self.read_new(name) for name in names}
+            if any(len(data) for data in new_data.values()):
+                last_update = time.monotonic()
+                yield new_data
+            elif timeout is not None and time.monotonic() - last_update > timeout:
+                return
+            time.sleep(interval)
+
+
 def get_dict(results: dict, *args) -> dict:
     get_dict = {}
     for key in args:
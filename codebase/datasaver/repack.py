@@ -0,0 +1,148 @@
+"""
+Finalise step for the datafiles written by DataSaver: the datasets grown during the run
+(resizable, chunked by h5py's guess, with the space left by the resizes) are rewritten
+into a compact layout suited to analysis.
+
+It runs when the DataSaver exits with DataSaver(db, finalise="contiguous"), or as a tool:
+    python -m qcrew.codebase.datasaver.repack <file.h5> --layout chunked --compression gzip
+"""
+import argparse
+import logging
+import os
+from pathlib import Path
+from typing import Optional, Union
+
+import h5py
+
+from qcrew.codebase.datasaver.hdf5_helper import StoragePolicy
+
+log = logging.getLogger(__name__)
+
+LAYOUTS = ("contiguous", "chunked")
+
+
+def repack_datafile(
+    filepath: Union[str, Path],
+    layout: str = "contiguous",
+    storage: Optional[StoragePolicy] = None,
+    chunk_bytes: int = 1 << 20,
+) -> Path:
+    """
+    Rewrite the resizable datasets of an hdf5 file at their final size, the other objects
+    and all the attributes are copied as they are. The file is replaced in one step once
+    the new one is complete.
+
+    Arguments:
+        filepath (str or Path): the hdf5 file to repack, it must be closed
+        layout (str):
+            "contiguous": no chunking, the fastest for whole array reads and np.memmap
+                access, but no compression
+            "chunked": chunks of whole sweeps for a block of repetitions, read along the
+                sweep axis and over repetition ranges, compressed with "storage"
+        storage (StoragePolicy): compression filters, dtype and, for the chunked layout, the
+            chunk shape. StoragePolicy(chunks=True) uses chunks of about "chunk_bytes"
+        chunk_bytes (int): target chunk size of the chunked layout
+
+    Return:
+        the path of the repacked file
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Layout should be one of {LAYOUTS}, got {layout}")
+    storage = storage or StoragePolicy()
+    if layout == "contiguous" and storage.compression is not None:
+        raise ValueError("Compressed datasets need the chunked layout")
+
+    filepath = Path(filepath)
+    tmp_path = filepath.with_name(filepath.name + ".repack")
+    try:
+        with h5py.File(filepath, "r") as src, h5py.File(tmp_path, "w") as dst:
+            _copy_group(src, dst, layout, storage, chunk_bytes)
+        os.replace(tmp_path, filepath)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+    log.info(f"Repacked {filepath} with the {layout} layout")
+    return filepath
+
+
+def _copy_group(src: h5py.Group, dst: h5py.Group, layout, storage, chunk_bytes) -> None:
+    for key, value in src.attrs.items():
+        dst.attrs[key] = value
+
+    for name, item in src.items():
+        if isinstance(item, h5py.Group):
+            _copy_group(item, dst.create_group(name), layout, storage, chunk_bytes)
+        elif _is_grown(item):
+            _repack_dataset(item, dst, name, layout, storage, chunk_bytes)
+        else:
+            src.copy(item, dst, name=name)
+
+
+def _is_grown(dataset: h5py.Dataset) -> bool:
+    """ Datasets created by DataHandle.update_result are resizable along the repetitions """
+    return (
+        not dataset.is_virtual
+        and dataset.maxshape is not None
+        and dataset.ndim > 0
+        and dataset.maxshape[0] is None
+    )
+
+
+def _repack_dataset(
+    dataset: h5py.Dataset, dst: h5py.Group, name: str, layout, storage, chunk_bytes
+) -> None:
+    shape = dataset.shape
+    dtype = storage.dtype if storage.dtype is not None else dataset.dtype
+    row_bytes = max(1, int(dtype.itemsize * (dataset.size // max(shape[0], 1))))
+    rows = max(1, min(shape[0], chunk_bytes // row_bytes))
+
+    if layout == "contiguous" or shape[0] == 0:
+        policy = StoragePolicy(chunks=False, dtype=dtype)
+        kwargs = {}
+    else:
+        chunks = rows if isinstance(storage.chunks, bool) else storage.chunks
+        policy = StoragePolicy(
+            chunks=chunks,
+            compression=storage.compression,
+            compression_opts=storage.compression_opts,
+            shuffle=storage.shuffle,
+            dtype=dtype,
+        )
+        kwargs = policy.dataset_kwargs(shape, fixed=True)
+
+    new_dataset = dst.create_dataset(name, shape=shape, dtype=dtype, **kwargs)
+    # copy by blocks of repetitions to bound the memory use
+    for start in range(0, shape[0], rows):
+        stop = min(start + rows, shape[0])
+        new_dataset[start:stop] = dataset[start:stop]
+
+    for key, value in dataset.attrs.items():
+        new_dataset.attrs[key] = value
+    policy.record(new_dataset)
+    new_dataset.attrs["layout"] = layout
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Repack the grown datasets of a file")
+    parser.add_argument("filepath")
+    parser.add_argument("--layout", choices=LAYOUTS, default="contiguous")
+    parser.add_argument("--compression", help='e.g. "gzip" or "lzf"')
+    parser.add_argument("--level", type=int, help="gzip compression level")
+    parser.add_argument("--shuffle", action="store_true")
+    parser.add_argument("--dtype", help='e.g. "float32"')
+    args = parser.parse_args()
+
+    storage = StoragePolicy(
+        compression=args.compression,
+        compression_opts=args.level,
+        shuffle=args.shuffle,
+        dtype=args.dtype,
+    )
+    size = os.path.getsize(args.filepath)
+    repack_datafile(args.filepath, layout=args.layout, storage=storage)
+    print(f"{size / 1e6:.2f} MB -> {os.path.getsize(args.filepath) / 1e6:.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
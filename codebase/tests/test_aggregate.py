@@ -0,0 +1,73 @@
+"""
+Checks of the results aggregated by DataSaver(aggregate=...).
+
+run with qcrew importable:
+    python -m pytest qcrew/codebase/tests
+"""
+import h5py
+import numpy as np
+
+from qcrew.codebase.datasaver.hdf5_helper import (
+    DataSaver,
+    initialise_database,
+    read_aggregate,
+    read_aggregate_covariance,
+)
+
+
+def test_aggregate_continues_in_reopened_file(tmp_path):
+    """ The statistics of several sessions reopening the file are those of all the shots """
+    sessions, shots, sweep = 3, 10, 21
+    rng = np.random.default_rng(0)
+    i_data = rng.normal(1.0, 0.5, (sessions * shots, sweep))
+    q_data = 0.3 * i_data + rng.normal(-1.0, 0.2, i_data.shape)
+
+    db = initialise_database(
+        exp_name="check", sample_name="aggregate", project_name="check", path=tmp_path
+    )
+    filepath = db.filepath
+    for session in range(sessions):
+        rows = slice(session * shots, (session + 1) * shots)
+        # each session reopens the file with a new DataHandle
+        if session > 0:
+            db = h5py.File(filepath, "a")
+        with DataSaver(db, aggregate=("I", "Q")) as datasaver:
+            datasaver.update_multiple_results(
+                {"I": i_data[rows], "Q": q_data[rows]}, save=["I", "Q"], group="data"
+            )
+
+    with h5py.File(filepath, "r") as file:
+        stats = read_aggregate(file["data"], "I")
+        covariance = read_aggregate_covariance(file["data"])
+
+    assert np.all(stats["count"] == i_data.shape[0])
+    assert np.allclose(stats["mean"], i_data.mean(axis=0))
+    assert np.allclose(stats["variance"], i_data.var(axis=0, ddof=1))
+    expected = [np.cov(i_data[:, j], q_data[:, j])[0, 1] for j in range(sweep)]
+    assert np.allclose(covariance, expected)
+
+
+def test_covariance_of_i_and_q_updated_separately(tmp_path):
+    """ I and Q given in separate update_result calls still give their covariance """
+    shots, sweep = 12, 5
+    rng = np.random.default_rng(1)
+    i_data = rng.normal(0.0, 1.0, (shots, sweep))
+    q_data = -0.5 * i_data + rng.normal(0.0, 0.3, i_data.shape)
+
+    db = initialise_database(
+        exp_name="check", sample_name="separate", project_name="check", path=tmp_path
+    )
+    filepath = db.filepath
+    with DataSaver(db, aggregate=("I", "Q")) as datasaver:
+        # Q lags I by a few shots and arrives in batches of a different size
+        datasaver.update_result("I", i_data[:8], group="data")
+        datasaver.update_result("Q", q_data[:5], group="data")
+        datasaver.update_result("I", i_data[8:], group="data")
+        datasaver.update_result("Q", q_data[5:], group="data")
+
+    with h5py.File(filepath, "r") as file:
+        assert np.all(file["data/aggregate/I_Q/count"][...] == shots)
+        covariance = read_aggregate_covariance(file["data"])
+
+    expected = [np.cov(i_data[:, j], q_data[:, j])[0, 1] for j in range(sweep)]
+    assert np.allclose(covariance, expected)
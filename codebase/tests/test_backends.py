@@ -0,0 +1,47 @@
+"""
+Checks of the results backends of DataSaver(backend=...).
+
+run with qcrew importable:
+    python -m pytest qcrew/codebase/tests
+"""
+import h5py
+import numpy as np
+import pytest
+
+from qcrew.codebase.datasaver.backends import open_results
+from qcrew.codebase.datasaver.hdf5_helper import DataSaver, initialise_database
+
+
+@pytest.mark.parametrize("backend", ["hdf5", "chunks", "npy"])
+def test_reopened_database_appends_to_backend(tmp_path, backend):
+    """ A second session on the same database continues the results of the first one """
+    db = initialise_database(
+        exp_name=backend, sample_name="check", project_name="check", path=tmp_path
+    )
+    filepath = db.filepath
+    for session in range(2):
+        if session > 0:
+            db = h5py.File(filepath, "a")
+        # 7 rows per session, not a whole number of chunks
+        with DataSaver(db, backend=backend, total_count=10) as datasaver:
+            datasaver.update_multiple_results(
+                {"I": np.full((7, 4), session + 1.0)}, save=["I"], group="data"
+            )
+
+    with h5py.File(filepath, "r") as file:
+        results = open_results(file)
+        data = results.read("data/I")
+        results.close()
+    assert data.shape == (14, 4)
+    assert np.all(data[:7] == 1) and np.all(data[7:] == 2)
+
+
+def test_other_backend_is_refused(tmp_path):
+    db = initialise_database(
+        exp_name="mismatch", sample_name="check", project_name="check", path=tmp_path
+    )
+    filepath = db.filepath
+    with DataSaver(db, backend="hdf5") as datasaver:
+        datasaver.update_multiple_results({"I": np.ones((3, 4))}, save=["I"], group="data")
+    with h5py.File(filepath, "a") as file, pytest.raises(ValueError):
+        DataSaver(file, backend="chunks").__enter__()
@@ -0,0 +1,65 @@
+"""
+Checks of the results written by DataSaver and DataHandle.
+
+run with qcrew importable:
+    python -m pytest qcrew/codebase/tests
+"""
+from pathlib import Path
+
+import h5py
+import numpy as np
+import pytest
+
+from qcrew.codebase.datasaver.hdf5_helper import DataSaver, initialise_database
+
+
+def _database(path, name):
+    return initialise_database(
+        exp_name=name, sample_name="check", project_name="check", path=path
+    )
+
+
+def test_untrimmed_preallocation_is_continued(tmp_path):
+    """ A file left preallocated, e.g. by a crash, is filled after its last written row """
+    db = _database(tmp_path, "crash")
+    filepath = db.filepath
+    datasaver = DataSaver(db, total_count=100)
+    handle = datasaver.__enter__()
+    handle.update_multiple_results({"I": np.ones((30, 4))}, save=["I"], group="data")
+    db.close()  # no __exit__, the dataset keeps its 100 preallocated rows
+
+    with DataSaver(h5py.File(filepath, "a"), total_count=100) as handle:
+        handle.update_multiple_results({"I": np.full((10, 4), 2.0)}, save=["I"], group="data")
+
+    with h5py.File(filepath, "r") as file:
+        data = file["data/I"][()]
+    assert data.shape == (40, 4)
+    assert np.all(data[:30] == 1) and np.all(data[30:] == 2)
+
+
+def test_results_are_trimmed_when_the_writer_fails(tmp_path):
+    """ The preallocated rows are cut even if the async writer fails on exit """
+    db = _database(tmp_path, "writer")
+    filepath = db.filepath
+    with pytest.raises(RuntimeError):
+        with DataSaver(db, async_write=True, total_count=100) as handle:
+            handle.update_multiple_results({"I": np.ones((30, 4))}, save=["I"], group="data")
+            # a batch of another shape makes the writer thread fail
+            handle.update_multiple_results({"I": np.ones((5, 3))}, save=["I"], group="data")
+
+    with h5py.File(filepath, "r") as file:
+        assert file["data/I"].shape == (30, 4)
+
+
+def test_files_are_catalogued_by_default(tmp_path):
+    """ initialise_database registers the file, and the DataSaver records its status """
+    from qcrew.codebase.datasaver.catalog import Catalog
+
+    db = _database(tmp_path, "catalogued")
+    filepath = db.filepath
+    with DataSaver(db) as handle:
+        handle.update_multiple_results({"I": np.ones((5, 3))}, save=["I"], group="data")
+
+    (entry,) = Catalog(tmp_path / "check").query(exp_name="catalogued")
+    assert entry["status"] == "complete"
+    assert Path(entry["filepath"]) == Path(filepath)
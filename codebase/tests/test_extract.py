@@ -0,0 +1,66 @@
+"""
+Checks of extract_pars_from_datafiles and its cache.
+
+run with qcrew importable:
+    python -m pytest qcrew/codebase/tests
+"""
+import json
+
+import h5py
+import numpy as np
+import pytest
+
+from qcrew.codebase.datasaver import hdf5_helper
+from qcrew.codebase.datasaver.hdf5_helper import extract_pars_from_datafiles
+
+
+@pytest.fixture
+def datafiles(tmp_path):
+    filepaths = []
+    for k in range(4):
+        filepath = tmp_path / "data" / f"{k}_T1.h5"
+        filepath.parent.mkdir(exist_ok=True)
+        with h5py.File(filepath, "w") as file:
+            file.create_group("fit").attrs["tau"] = 10.0 + k
+            file["raw"] = np.full(10000, k, dtype=float)
+        filepaths.append(str(filepath))
+    return filepaths
+
+
+def _fail(*args, **kwargs):
+    raise RuntimeError("extracted again")
+
+
+def test_cache_is_kept_between_sessions(tmp_path, datafiles, monkeypatch):
+    """ Small parameters are read from the user cache, raw data is extracted again """
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    spec = {"T1": ("fit", "attr:tau")}
+    first = extract_pars_from_datafiles(spec, datafiles, processes=1)
+
+    cache_path = tmp_path / "cache" / "qcrew" / hdf5_helper.EXTRACT_CACHE
+    assert len(json.loads(cache_path.read_text())) == 4
+    assert not list((tmp_path / "data").glob("*cache*"))
+
+    # a new session, nothing is extracted from the files
+    monkeypatch.setattr(hdf5_helper, "extract_pars_from_datafile", _fail)
+    second = extract_pars_from_datafiles(spec, datafiles, processes=1)
+    assert np.array_equal(first["T1"], second["T1"])
+
+    with pytest.raises(RuntimeError):
+        extract_pars_from_datafiles({"raw": ("raw", "dset")}, datafiles, processes=1)
+
+
+def test_cache_is_bounded(tmp_path, datafiles, monkeypatch):
+    monkeypatch.setattr(hdf5_helper, "EXTRACT_CACHE_ENTRIES", 3)
+    cache_path = tmp_path / "extract_cache.json"
+    spec = {"T1": ("fit", "attr:tau")}
+    extract_pars_from_datafiles(spec, datafiles, processes=1, cache_path=cache_path)
+    assert len(json.loads(cache_path.read_text())) == 3
+
+
+def test_vanished_file_is_skipped(tmp_path, datafiles):
+    filepaths = datafiles + [str(tmp_path / "data" / "moved_T1.h5")]
+    columns = extract_pars_from_datafiles(
+        {"T1": ("fit", "attr:tau")}, filepaths, processes=1, use_cache=False, skip_errors=True
+    )
+    assert len(columns["filepath"]) == 4
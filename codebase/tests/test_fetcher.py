@@ -0,0 +1,75 @@
+"""
+Checks of Fetcher against the simulated QM result handles of utils/qm_simulator.py.
+
+run with qcrew and the qm package importable:
+    python -m pytest qcrew/codebase/tests
+"""
+import collections
+import threading
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("qm")
+
+from qcrew.codebase.utils import qm_simulator
+from qcrew.codebase.utils.fetcher import Fetcher
+from qcrew.codebase.utils.qm_simulator import simulate_iq_job
+
+
+def test_stream_ends_when_job_is_halted():
+    """ A job stopped before total_count ends the stream instead of polling forever """
+    job = simulate_iq_job(reps=10000, sweep_points=20, rate=2000)
+    fetcher = Fetcher(handle=job.result_handles, num_results=10000, static_tags=["X"])
+    threading.Timer(0.2, job.halt).start()
+
+    calls, start = 0, time.monotonic()
+    for _ in fetcher.stream(min_new=1):
+        calls += 1
+        assert time.monotonic() - start < 5, "the stream did not end after the halt"
+    assert not fetcher.is_fetching
+    assert fetcher.count < 10000
+    assert calls < 1000
+
+
+def _count_calls(monkeypatch) -> collections.Counter:
+    """ Count the count_so_far probes and fetch_all downloads of the single results """
+    calls = collections.Counter()
+    count_so_far = qm_simulator.SimulatedSingleResult.count_so_far
+    fetch_all = qm_simulator.SimulatedSingleResult.fetch_all
+
+    def counted_count_so_far(self):
+        calls[self.name, "probe"] += 1
+        return count_so_far(self)
+
+    def counted_fetch_all(self, flat_struct=True):
+        calls[self.name, "fetch"] += 1
+        return fetch_all(self, flat_struct)
+
+    monkeypatch.setattr(
+        qm_simulator.SimulatedSingleResult, "count_so_far", counted_count_so_far
+    )
+    monkeypatch.setattr(qm_simulator.SimulatedSingleResult, "fetch_all", counted_fetch_all)
+    return calls
+
+
+@pytest.mark.parametrize("probe_versions", [False, True])
+def test_single_results(monkeypatch, probe_versions):
+    """ Static tags are downloaded once, the others are only probed if asked to """
+    calls = _count_calls(monkeypatch)
+    job = simulate_iq_job(reps=1000, sweep_points=20, rate=4000)
+    fetcher = Fetcher(
+        handle=job.result_handles,
+        num_results=1000,
+        static_tags=["X"],
+        probe_versions=probe_versions,
+    )
+    batches = 0
+    for count, results in fetcher.stream(min_new=1, min_period=0.02):
+        batches += 1
+    assert calls["X", "fetch"] == 1
+    assert calls["Y_AVG", "fetch"] == batches
+    assert calls["Y_AVG", "probe"] == (2 if probe_versions else 0)
+    # the last batch holds the final average, not a stale one
+    assert np.allclose(results["Y_AVG"], job.result_handles.Y_AVG.fetch_all())
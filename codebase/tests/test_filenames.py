@@ -0,0 +1,71 @@
+"""
+Checks of the datafile naming of initialise_database.
+
+run with qcrew importable:
+    python -m pytest qcrew/codebase/tests
+"""
+import multiprocessing
+
+import pytest
+
+from qcrew.codebase.datasaver.hdf5_helper import initialise_database
+
+NUM_PROCESSES = 16
+NUM_NAMES = 20
+
+_barrier = None
+
+
+def _init_worker(barrier) -> None:
+    global _barrier
+    _barrier = barrier
+
+
+def _create_files(path: str, num_names: int, timesubdir: bool) -> list:
+    """ Create "num_names" datafiles as soon as all the processes are ready """
+    _barrier.wait()
+    filepaths = []
+    for _ in range(num_names):
+        db = initialise_database(
+            exp_name="stress",
+            sample_name="naming",
+            project_name="check",
+            path=path,
+            timesubdir=timesubdir,
+        )
+        filepaths.append(db.filepath)
+        db.close()
+    return filepaths
+
+
+@pytest.mark.parametrize("timesubdir", [False, True])
+def test_concurrent_names_are_unique(tmp_path, timesubdir):
+    """ Processes creating datafiles of the same name at the same time get distinct paths """
+    barrier = multiprocessing.Barrier(NUM_PROCESSES)
+    with multiprocessing.Pool(
+        NUM_PROCESSES, initializer=_init_worker, initargs=(barrier,)
+    ) as pool:
+        results = pool.starmap(
+            _create_files, [(str(tmp_path), NUM_NAMES, timesubdir)] * NUM_PROCESSES
+        )
+    filepaths = [filepath for result in results for filepath in result]
+    assert len(set(filepaths)) == NUM_PROCESSES * NUM_NAMES
+
+
+def test_untagged_file_is_appended_to(tmp_path):
+    """ Two sessions with timefilename=False share the file, the first data is kept """
+    paths, keys = [], []
+    for session in range(2):
+        db = initialise_database(
+            exp_name="append",
+            sample_name="naming",
+            project_name="check",
+            path=tmp_path,
+            timefilename=False,
+        )
+        db.create_dataset(f"session_{session}", data=[session])
+        paths.append(db.filepath)
+        keys.append(sorted(db.keys()))
+        db.close()
+    assert paths[0] == paths[1]
+    assert keys[1] == ["session_0", "session_1"]
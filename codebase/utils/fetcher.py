@@ -1,5 +1,7 @@
 """ Qcrew QM result fetcher v1.0 """
-from typing import Callable
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
 import numpy as np
 from qm.QmJob import JobResults
 from qm._results import SingleNamedJobResult, MultipleNamedJobResult
@@ -7,21 +9,58 @@ from qm._results import SingleNamedJobResult, MultipleNamedJobResult
 
 class Fetcher:
 
-    def __init__(self, handle: JobResults, num_results: int) -> None:
+    def __init__(
+        self,
+        handle: JobResults,
+        num_results: int,
+        min_interval: float = 0.01,
+        max_interval: float = 0.5,
+        max_workers: int = 4,
+        accumulate: bool = False,
+        static_tags: tuple = (),
+        probe_versions: bool = False,
+    ) -> None:
         """Initialize a Fetcher instance.
 
         Args:
             handle (JobResults): QM job result handle
             num_results (int): total number of results expected to be fetched
+            min_interval (float): first polling interval in seconds of a blocking fetch
+            max_interval (float): the polling interval doubles while no results arrive, up to this value
+            max_workers (int): number of threads fetching the tags concurrently, each fetch being a round trip to the QM server. 1 fetches the tags one after another
+            accumulate (bool): if True, the Fetcher keeps the full history of each MultipleNamedJobResult tag in an array preallocated for num_results rows, see self.results. The partial results are then read-only views of these arrays
+            static_tags (tuple): SingleNamedJobResult tags that do not change during the run, e.g. the sweep variables, fetched only once
+            probe_versions (bool): if True, the other SingleNamedJobResult tags are probed with count_so_far and only downloaded again if it has advanced. This relies on the server counting each save() of a single result, which is only checked against utils/qm_simulator.py so far, hence off by default
         """
         self.total_count: int = num_results  # tota number of results to fetch
         self.count: int = 0  # current number of results fetched
         self.last_count: int = None  # last known result count
 
+        self.min_interval: float = min_interval
+        self.max_interval: float = max_interval
+        self._last_return: float = None  # time of the last fetch that returned results
+
         self.handle: JobResults = handle
         self._spec: dict[str, Callable] = {"single": dict(), "multiple": dict()}
         self._pre_process_results()
 
+        self.timings: dict[str, float] = dict()  # tag -> duration (s) of its last fetch
+        self.fetch_time: float = None  # duration (s) of the last fetch of all tags
+        num_tags = len(self._spec["single"]) + len(self._spec["multiple"])
+        self._executor: ThreadPoolExecutor = None
+        if max_workers > 1 and num_tags > 1:
+            self._executor = ThreadPoolExecutor(
+                max_workers=min(max_workers, num_tags), thread_name_prefix="Fetcher"
+            )
+
+        self.accumulate: bool = accumulate
+        self._buffers: dict[str, np.ndarray] = dict()  # tag -> accumulated results
+        self._single_results: dict[str, np.ndarray] = dict()  # tag -> last fetched value
+        self.static_tags: set = set(static_tags)
+        self._single_cache: dict[str, tuple] = dict()  # tag -> (version, value)
+        self.probe_versions: bool = probe_versions
+        self._changing_tags: set = set()  # single tags seen changing between two fetches
+
         self.is_fetching: bool = True  # to indicate fetching has started
 
     def _pre_process_results(self):
@@ -34,36 +73,198 @@ class Fetcher:
                 self._spec["multiple"][tag] = self._fetch_multiple
                 result.wait_for_values(2)
 
-    def fetch(self) -> tuple:
+    def fetch(
+        self, min_new: int = 0, timeout: Optional[float] = None, min_period: float = 0.0
+    ) -> tuple:
         """To be called during a live measurement post-processing loop. Fetches the latest available results for all tags in result handle.
 
+        Args:
+            min_new (int): if > 0, block until at least this many new results are available for all tags, the job stops processing, or the timeout. Fewer results are waited for near the end of the run.
+            timeout (float): maximum blocking time in seconds, None to wait as long as needed
+            min_period (float): minimum time in seconds between two fetches that return results, to limit the rate of the live loop (saving, plotting) without a fixed sleep
+
         Returns:
             dict[str, np.ndarray]: key -> result handle tag, value -> (1) for MultipleNamedJobResult, value is the numpy array returned by calling handle.get(tag).fetch_all(flat_struct = True). (2) For SingleNamedJobResult, value is the numpy array returned by calling handle.get(tag).fetch_all(flat_struct = True).
         """
+        start = time.monotonic()
+        if min_period and self._last_return is not None:
+            wait = self._last_return + min_period - start
+            if timeout is not None:
+                wait = min(wait, timeout)
+            if wait > 0:
+                time.sleep(wait)
+        if min_new > 0:
+            remaining = None if timeout is None else timeout - (time.monotonic() - start)
+            self._wait_for_results(min_new, remaining)
+
         self.last_count = self.count  # get and update counts
-        self.count = min(len(self.handle.get(tag)) for tag in self._spec["multiple"])
+        self.count = self._count_so_far()
 
-        if self.count == self.last_count:  # no new results to fetch
-            if not self.handle.is_processing() and self.count >= self.total_count:
+        if self.count == self.last_count and not self.handle.is_processing():
+            if self.count < self.total_count:
+                # the last results of a halted or failed job may still be on their way
+                time.sleep(self.max_interval)
+                self.count = self._count_so_far()
+            if self.count == self.last_count:
                 self.is_fetching = False  # fetching is complete
+                self.close()
                 if self.count > self.total_count:
                     print(f"WARNING: EXTRA RESULTS ({self.count}, {self.total_count})")
+                elif self.count < self.total_count:
+                    print(f"WARNING: MISSING RESULTS ({self.count}, {self.total_count})")
+
+        if self.count == self.last_count:  # no new results to fetch
             return (self.count, dict())  # return empty dict because no new results to fetch
 
-        partial_results = dict()  # populate and return partial results dictionary
-        for result_type in self._spec:
-            for tag in self._spec[result_type]:
-                partial_results[tag] = self._spec[result_type][tag](tag)
+        partial_results = self._fetch_tags()  # populate and return partial results dictionary
+        self._last_return = time.monotonic()
         return (self.count, partial_results)
 
+    def __iter__(self):
+        """Iterate over the (count, partial_results) batches of the run, see stream()."""
+        return self.stream()
+
+    def stream(self, min_new: int = 1, min_period: float = 0.0):
+        """Yield the (count, partial_results) batches of the run, blocking until new results are available, instead of polling fetch() in a loop. The arguments are passed to fetch().
+
+        Example:
+            for (num_so_far, update_results) in fetcher.stream(min_period=1):
+                datasaver.update_multiple_results(update_results, save=["I", "Q"], group="data")
+        """
+        while self.is_fetching:
+            count, partial_results = self.fetch(min_new=min_new, min_period=min_period)
+            if partial_results:
+                yield count, partial_results
+
+    def _fetch_tags(self) -> dict:
+        """Fetch all the tags, concurrently if there is a thread pool. All the tags are fetched up to the same self.count, so the partial results stay consistent whatever the order the fetches complete in."""
+        start = time.perf_counter()
+        tags = [
+            (tag, fetch_fn)
+            for result_type in self._spec
+            for tag, fetch_fn in self._spec[result_type].items()
+        ]
+        if self._executor is None:
+            partial_results = dict(self._timed_fetch(tag, fetch_fn) for tag, fetch_fn in tags)
+        else:
+            futures = [
+                self._executor.submit(self._timed_fetch, tag, fetch_fn)
+                for tag, fetch_fn in tags
+            ]
+            partial_results = dict(future.result() for future in futures)
+        self.fetch_time = time.perf_counter() - start
+        return partial_results
+
+    def _timed_fetch(self, tag: str, fetch_fn: Callable) -> tuple:
+        start = time.perf_counter()
+        result = fetch_fn(tag)
+        self.timings[tag] = time.perf_counter() - start
+        return tag, result
+
+    def close(self) -> None:
+        """Stop the fetching threads."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _count_so_far(self) -> int:
+        """ Number of results available for all MultipleNamedJobResult tags """
+        return min(len(self.handle.get(tag)) for tag in self._spec["multiple"])
+
+    def _wait_for_results(self, min_new: int, timeout: Optional[float]) -> None:
+        """Wait with an adaptive backoff until min_new results are available after self.count for all tags. The polling interval starts at min_interval and doubles while no result arrives, so a slow job is not flooded with count requests and a fast one is followed closely."""
+        target = min(self.count + min_new, self.total_count)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        interval = self.min_interval
+        count = self._count_so_far()
+        while count < target and self.handle.is_processing():
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                time.sleep(min(interval, remaining))
+            else:
+                time.sleep(interval)
+            new_count = self._count_so_far()
+            # back off while nothing arrives, poll fast again once results flow
+            if new_count > count:
+                interval = self.min_interval
+            else:
+                interval = min(2 * interval, self.max_interval)
+            count = new_count
+
+    @property
+    def results(self) -> dict:
+        """Full history of the results fetched so far when accumulating: key -> result handle tag, value -> (1) for MultipleNamedJobResult, a read-only view of the first self.count rows of the accumulated array, no copy is made. (2) For SingleNamedJobResult, the last fetched value.
+
+        The views stay valid, but only show the rows fetched when they were taken, get them again after each fetch.
+        """
+        results = {tag: _read_only(buffer[: self.count]) for tag, buffer in self._buffers.items()}
+        results.update(self._single_results)
+        return results
+
     def _fetch_single(self, tag):
-        """ Internal method for dealing with SingleNamedJobResult """
-        return self.handle.get(tag).fetch_all(flat_struct=True)
+        """ Internal method for dealing with SingleNamedJobResult. A static tag is downloaded once. With probe_versions, a tag which has not changed so far is probed with count_so_far, and only downloaded again if it has changed since the last fetch, otherwise the cached value is returned. A tag seen changing, e.g. a running average, is downloaded without probing """
+        result_handle = self.handle.get(tag)
+        cached = self._single_cache.get(tag)
+        if cached is not None and tag in self.static_tags:
+            result = cached[1]
+        elif not self.probe_versions or tag in self._changing_tags:
+            # the tags are only fetched once the repetitions have advanced, so a changing
+            # tag has almost surely changed, and the probe would only add a round trip
+            result = result_handle.fetch_all(flat_struct=True)
+            if tag in self.static_tags:
+                self._single_cache[tag] = (None, result)
+        else:
+            version = _get_version(result_handle)
+            if cached is not None and version is not None and version == cached[0]:
+                result = cached[1]
+            else:
+                result = result_handle.fetch_all(flat_struct=True)
+                if cached is not None:
+                    self._changing_tags.add(tag)
+                    del self._single_cache[tag]
+                else:
+                    self._single_cache[tag] = (version, result)
+        if self.accumulate:
+            self._single_results[tag] = result
+        return result
 
     def _fetch_multiple(self, tag):
         """ Internal method for dealing with MultipleNamedJobResult """
         slc = slice(self.last_count, self.count)
-        return self.handle.get(tag).fetch(slc, flat_struct=True)
+        result = self.handle.get(tag).fetch(slc, flat_struct=True)
+        if self.accumulate:
+            return self._accumulate(tag, result)
+        return result
+
+    def _accumulate(self, tag: str, batch: np.ndarray) -> np.ndarray:
+        """Write the batch in place in the accumulated array of the tag, return a read-only view of it. The array is allocated once for total_count rows, and only grown if the job returns more results than expected."""
+        buffer = self._buffers.get(tag)
+        if buffer is None:
+            rows = max(self.total_count, self.count)
+            buffer = np.empty((rows,) + batch.shape[1:], dtype=batch.dtype)
+        elif self.count > buffer.shape[0]:  # extra results
+            rows = max(self.count, 2 * buffer.shape[0])
+            grown = np.empty((rows,) + buffer.shape[1:], dtype=buffer.dtype)
+            grown[: self.last_count] = buffer[: self.last_count]
+            buffer = grown
+        buffer[self.last_count : self.count] = batch
+        self._buffers[tag] = buffer
+        return _read_only(buffer[self.last_count : self.count])
+
+
+def _get_version(result_handle) -> Optional[int]:
+    """ Number of values saved so far to a result, which advances whenever the result changes, or None if the result handle does not report it """
+    count_so_far = getattr(result_handle, "count_so_far", None)
+    return count_so_far() if count_so_far is not None else None
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    """ Return a view of the array that cannot be written """
+    view = array.view()
+    view.flags.writeable = False
+    return view
 
 
 
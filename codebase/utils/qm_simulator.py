@@ -0,0 +1,232 @@
+""" Qcrew offline QM result handle simulator v1.0
+
+Local stand-ins for the QM JobResults, SingleNamedJobResult and MultipleNamedJobResult, so
+that the live fetch -> save -> stats -> plot chain can be run, benchmarked and debugged
+without an OPX. The results appear at a configurable rate of repetitions per second, and
+each call to the "server" can be given a latency.
+
+The simulated classes subclass the QM ones, so Fetcher and fetch_helper recognise them.
+
+Example:
+    job = simulate_iq_job(reps=2000, sweep_points=250, rate=500, latency=0.005)
+    fetcher = Fetcher(handle=job.result_handles, num_results=2000, static_tags=["X"])
+"""
+import time
+from typing import Callable, Optional
+
+import numpy as np
+from qm.QmJob import JobResults
+from qm._results import SingleNamedJobResult, MultipleNamedJobResult
+
+
+class SimulatedJobResults(JobResults):
+    def __init__(
+        self,
+        total_count: int,
+        rate: float,
+        latency: float = 0.0,
+        start_delay: float = 0.0,
+    ) -> None:
+        """Result handles of a simulated job, the repetitions are done at a constant rate once the job starts.
+
+        Args:
+            total_count (int): number of repetitions of the job
+            rate (float): repetitions per second
+            latency (float): duration in seconds of each call to the simulated QM server
+            start_delay (float): time in seconds before the first repetition
+        """
+        self.total_count: int = total_count
+        self.rate: float = rate
+        self.latency: float = latency
+        self._start: float = time.monotonic() + start_delay
+        self._halted_count: int = None  # number of repetitions done when halted
+        self._results: dict = dict()  # tag -> simulated named result
+
+    def add_multiple(self, tag: str, data: np.ndarray) -> None:
+        """Add a save_all() result, "data" holds one row per repetition, shape (total_count, buffer...)."""
+        if data.shape[0] != self.total_count:
+            raise ValueError(f"{tag} should have {self.total_count} rows, got {data.shape[0]}")
+        self._results[tag] = SimulatedMultipleResult(self, tag, data)
+
+    def add_single(self, tag: str, value_fn: Callable, static: bool = False) -> None:
+        """Add a save() result, whose value after "count" repetitions is value_fn(count). A static result, e.g. a sweep variable, is saved once at the first repetition."""
+        self._results[tag] = SimulatedSingleResult(self, tag, value_fn, static)
+
+    def _wait(self) -> None:
+        """ Simulate the round trip to the QM server """
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _count(self) -> int:
+        """ Number of repetitions done so far """
+        if self._halted_count is not None:
+            return self._halted_count
+        elapsed = time.monotonic() - self._start
+        return max(0, min(self.total_count, int(elapsed * self.rate)))
+
+    def halt(self) -> None:
+        self._halted_count = self._count()
+
+    def is_processing(self) -> bool:
+        self._wait()
+        return self._halted_count is None and self._count() < self.total_count
+
+    def wait_for_all_values(self, timeout: Optional[float] = None) -> bool:
+        for result in self._results.values():
+            if not result.wait_for_all_values(timeout):
+                return False
+        return True
+
+    def get(self, tag: str):
+        return self._results[tag]
+
+    def __getattr__(self, tag: str):
+        results = self.__dict__.get("_results", {})
+        if tag in results:
+            return results[tag]
+        raise AttributeError(tag)
+
+    def __iter__(self):
+        return iter(self._results.items())
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+
+class SimulatedMultipleResult(MultipleNamedJobResult):
+    """ A simulated save_all() result, one row per repetition """
+
+    def __init__(self, job: SimulatedJobResults, tag: str, data: np.ndarray) -> None:
+        self._job: SimulatedJobResults = job
+        self.name: str = tag
+        self._data: np.ndarray = data
+
+    def count_so_far(self) -> int:
+        self._job._wait()
+        return self._job._count()
+
+    def __len__(self) -> int:
+        return self.count_so_far()
+
+    def wait_for_values(self, count: int = 1, timeout: Optional[float] = None) -> None:
+        """Block until "count" rows are available, raise a TimeoutError after "timeout" seconds"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.count_so_far() < count:
+            if self._job._halted_count is not None:
+                raise RuntimeError(f"The job was halted before {count} values of {self.name}")
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Timeout while waiting for {count} values of {self.name}")
+            time.sleep(0.01)
+
+    def wait_for_all_values(self, timeout: Optional[float] = None) -> bool:
+        try:
+            self.wait_for_values(self._job.total_count, timeout)
+        except (TimeoutError, RuntimeError):
+            return False
+        return True
+
+    def fetch(self, item, flat_struct: bool = True) -> np.ndarray:
+        """Return the rows of the slice "item" that are available"""
+        self._job._wait()
+        count = self._job._count()
+        if isinstance(item, slice):
+            start, stop, step = item.indices(count)
+            return self._data[start:stop:step].copy()
+        return self._data[:count][item].copy()
+
+    def fetch_all(self, flat_struct: bool = True) -> np.ndarray:
+        return self.fetch(slice(None), flat_struct)
+
+
+class SimulatedSingleResult(SingleNamedJobResult):
+    """ A simulated save() result, holding its last saved value """
+
+    def __init__(
+        self, job: SimulatedJobResults, tag: str, value_fn: Callable, static: bool
+    ) -> None:
+        self._job: SimulatedJobResults = job
+        self.name: str = tag
+        self._value_fn: Callable = value_fn
+        self._static: bool = static
+
+    def count_so_far(self) -> int:
+        """ Number of values saved so far """
+        self._job._wait()
+        count = self._job._count()
+        return min(count, 1) if self._static else count
+
+    def wait_for_values(self, count: int = 1, timeout: Optional[float] = None) -> None:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.count_so_far() < count:
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Timeout while waiting for {count} values of {self.name}")
+            time.sleep(0.01)
+
+    def wait_for_all_values(self, timeout: Optional[float] = None) -> bool:
+        total = 1 if self._static else self._job.total_count
+        try:
+            self.wait_for_values(total, timeout)
+        except TimeoutError:
+            return False
+        return True
+
+    def fetch_all(self, flat_struct: bool = True):
+        self._job._wait()
+        count = self._job._count()
+        if count == 0:
+            return None
+        return self._value_fn(count)
+
+
+class SimulatedJob:
+    """ Stand-in for a QmJob, only exposing its result handles """
+
+    def __init__(self, result_handles: SimulatedJobResults) -> None:
+        self.result_handles: SimulatedJobResults = result_handles
+
+    def halt(self) -> None:
+        self.result_handles.halt()
+
+
+def simulate_iq_job(
+    reps: int,
+    sweep_points=250,
+    rate: float = 1000.0,
+    latency: float = 0.0,
+    sweep_tag: str = "X",
+    seed: int = 0,
+) -> SimulatedJob:
+    """Simulate a v4 style job with the tags I, Q, Y_SQ_RAW (save_all of the raw shots), Y_AVG (save of the averaged signal) and the static sweep variable.
+
+    Args:
+        reps (int): number of repetitions
+        sweep_points (int or tuple): buffer shape of one repetition, e.g. 250 or (qu_a, rr_a, rr_f)
+        rate (float): repetitions per second
+        latency (float): duration in seconds of each call to the simulated QM server
+        sweep_tag (str): tag of the sweep variable
+        seed (int): seed of the random data
+    """
+    shape = (sweep_points,) if isinstance(sweep_points, int) else tuple(sweep_points)
+    rng = np.random.default_rng(seed)
+    lsb = 2.0 ** -28  # resolution of the QUA fixed type
+    sweep = np.linspace(0, 1, int(np.prod(shape))).reshape(shape)
+
+    # a sinusoidal response, e.g. a Rabi oscillation, blurred by gaussian noise
+    i_mean = 2e-4 * np.cos(2 * np.pi * sweep)
+    q_mean = -1e-4 * np.sin(2 * np.pi * sweep)
+    i_data = np.round((i_mean + rng.normal(0, 5e-5, (reps,) + shape)) / lsb) * lsb
+    q_data = np.round((q_mean + rng.normal(0, 5e-5, (reps,) + shape)) / lsb) * lsb
+    y_sq_raw = i_data ** 2 + q_data ** 2
+    counts = np.arange(1, reps + 1).reshape((reps,) + (1,) * len(shape))
+    i_avg = np.cumsum(i_data, axis=0) / counts
+    q_avg = np.cumsum(q_data, axis=0) / counts
+
+    handles = SimulatedJobResults(total_count=reps, rate=rate, latency=latency)
+    handles.add_multiple("I", i_data)
+    handles.add_multiple("Q", q_data)
+    handles.add_multiple("Y_SQ_RAW", y_sq_raw)
+    handles.add_single(
+        "Y_AVG", lambda count: i_avg[count - 1] ** 2 + q_avg[count - 1] ** 2
+    )
+    handles.add_single(sweep_tag, lambda count: sweep, static=True)
+    return SimulatedJob(handles)
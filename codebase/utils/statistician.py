@@ -26,6 +26,315 @@ def get_std_err(xs, ms, n, std_err=None, m=None, s=None):
     std_err = np.sqrt(new_s / (n * (n - 1)))
     return std_err, new_m, new_s
 
+class RunningStats:
+    """
+    Streaming mean and variance per sweep point, updated with batches of raw repetitions
+    with Chan's parallel form of Welford's algorithm. Accumulators of different batches,
+    threads or files can be merged, e.g. stats_a.merge(stats_b).
+
+    Unlike get_std_err, it only needs the raw data, and does not allocate temporaries of
+    the batch size: the batches are reduced by blocks of "block_rows" repetitions.
+
+    Arguments:
+        shape (tuple): shape of one repetition, e.g. (sweep_length,), by default taken
+            from the first batch
+        block_rows (int): number of repetitions reduced at once
+
+    example:
+        stats = RunningStats()
+        stats.update(np.sqrt(update_results["Y_SQ_RAW"]))
+        plotter.live_plot(xs, ys, num_so_far, err=stats.std_err)
+    """
+
+    def __init__(self, shape: tuple = None, block_rows: int = 256):
+        self.block_rows = block_rows
+        self.count = 0
+        self.mean = None
+        self.m2 = None  # sum of squares of differences from the current mean
+        if shape is not None:
+            self._reset(tuple(shape))
+
+    def __repr__(self):
+        shape = None if self.mean is None else self.mean.shape
+        return f"RunningStats(count={self.count}, shape={shape})"
+
+    def _reset(self, shape: tuple) -> None:
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def update(self, xs) -> "RunningStats":
+        """
+        Add a batch of raw data, xs.shape[0] being the repetition dimension.
+        """
+        xs = np.asarray(xs)
+        if self.mean is None:
+            self._reset(xs.shape[1:])
+        elif xs.shape[1:] != self.mean.shape:
+            raise ValueError(
+                f"The batch has repetitions of shape {xs.shape[1:]}, "
+                f"expected {self.mean.shape}"
+            )
+        for start in range(0, xs.shape[0], self.block_rows):
+            block = xs[start : start + self.block_rows]
+            block_mean = block.mean(axis=0)
+            block_m2 = ((block - block_mean) ** 2).sum(axis=0)
+            self._combine(block.shape[0], block_mean, block_m2)
+        return self
+
+    def merge(self, other: "RunningStats") -> "RunningStats":
+        """
+        Add the data of another accumulator to this one.
+        """
+        if other.count == 0:
+            return self
+        if self.mean is None:
+            self._reset(other.mean.shape)
+        elif other.mean.shape != self.mean.shape:
+            raise ValueError(f"Cannot merge shapes {other.mean.shape} and {self.mean.shape}")
+        self._combine(other.count, other.mean, other.m2)
+        return self
+
+    def _combine(self, count: int, mean: np.ndarray, m2: np.ndarray) -> None:
+        # Chan et al. pairwise update of the count, mean and sum of squares
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * (count / total)
+        self.m2 += m2 + delta ** 2 * (self.count * count / total)
+        self.count = total
+
+    @property
+    def variance(self) -> np.ndarray:
+        """ Sample variance, nan until there are two repetitions """
+        if self.mean is None:
+            return np.nan  # the shape is unknown until the first update
+        if self.count < 2:
+            return np.full_like(self.mean, np.nan)
+        return self.m2 / (self.count - 1)
+
+    @property
+    def std_err(self) -> np.ndarray:
+        """ Standard error of the mean, nan until there are two repetitions """
+        if self.count < 2:
+            return self.variance
+        return np.sqrt(self.variance / self.count)
+
+    def state(self) -> dict:
+        """
+        Return the accumulator as a dictionary, e.g. to be saved with
+        DataHandle.add_multiple_results and restored with RunningStats.from_state.
+        """
+        return {"count": self.count, "mean": self.mean, "m2": self.m2}
+
+    @classmethod
+    def from_state(cls, state: dict, block_rows: int = 256) -> "RunningStats":
+        stats = cls(block_rows=block_rows)
+        stats.count = int(state["count"])
+        stats.mean = np.array(state["mean"], dtype=float)
+        stats.m2 = np.array(state["m2"], dtype=float)
+        return stats
+
+
+class IQStats:
+    """
+    Streaming statistics of complex I/Q data per sweep point: the means of I and Q, their
+    2x2 covariance and the count, updated with batches of raw I and Q repetitions and
+    mergeable like RunningStats.
+
+    The amplitude and phase are derived from the averaged I/Q point, with their errors
+    propagated from the covariance, instead of averaging the magnitude of the raw shots,
+    which mixes the averaging order and is biased at low signal to noise ratio.
+
+    Arguments:
+        shape (tuple): shape of one repetition, by default taken from the first batch
+        block_rows (int): number of repetitions reduced at once
+
+    example:
+        iq_stats = IQStats()
+        iq_stats.update(update_results["I"], update_results["Q"])
+        amps, amp_errs = iq_stats.amplitude()
+    """
+
+    def __init__(self, shape: tuple = None, block_rows: int = 256):
+        self.block_rows = block_rows
+        self.count = 0
+        self.mean_i = None
+        self.mean_q = None
+        # sums of products of differences from the current means
+        self.c_ii = None
+        self.c_qq = None
+        self.c_iq = None
+        if shape is not None:
+            self._reset(tuple(shape))
+
+    def __repr__(self):
+        shape = None if self.mean_i is None else self.mean_i.shape
+        return f"IQStats(count={self.count}, shape={shape})"
+
+    def _reset(self, shape: tuple) -> None:
+        self.mean_i, self.mean_q = np.zeros(shape), np.zeros(shape)
+        self.c_ii, self.c_qq, self.c_iq = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+
+    def update(self, i_data, q_data) -> "IQStats":
+        """
+        Add a batch of raw I and Q data, the first dimension being the repetitions.
+        """
+        i_data, q_data = np.asarray(i_data), np.asarray(q_data)
+        if i_data.shape != q_data.shape:
+            raise ValueError(f"I and Q have different shapes {i_data.shape}, {q_data.shape}")
+        if self.mean_i is None:
+            self._reset(i_data.shape[1:])
+        elif i_data.shape[1:] != self.mean_i.shape:
+            raise ValueError(
+                f"The batch has repetitions of shape {i_data.shape[1:]}, "
+                f"expected {self.mean_i.shape}"
+            )
+        for start in range(0, i_data.shape[0], self.block_rows):
+            i_block = i_data[start : start + self.block_rows]
+            q_block = q_data[start : start + self.block_rows]
+            mean_i, mean_q = i_block.mean(axis=0), q_block.mean(axis=0)
+            delta_i, delta_q = i_block - mean_i, q_block - mean_q
+            self._combine(
+                i_block.shape[0],
+                mean_i,
+                mean_q,
+                (delta_i ** 2).sum(axis=0),
+                (delta_q ** 2).sum(axis=0),
+                (delta_i * delta_q).sum(axis=0),
+            )
+        return self
+
+    def merge(self, other: "IQStats") -> "IQStats":
+        """
+        Add the data of another accumulator to this one.
+        """
+        if other.count == 0:
+            return self
+        if self.mean_i is None:
+            self._reset(other.mean_i.shape)
+        elif other.mean_i.shape != self.mean_i.shape:
+            raise ValueError(
+                f"Cannot merge shapes {other.mean_i.shape} and {self.mean_i.shape}"
+            )
+        self._combine(
+            other.count, other.mean_i, other.mean_q, other.c_ii, other.c_qq, other.c_iq
+        )
+        return self
+
+    def _combine(self, count, mean_i, mean_q, c_ii, c_qq, c_iq) -> None:
+        # Chan et al. pairwise update, with the cross term for the covariance
+        total = self.count + count
+        delta_i, delta_q = mean_i - self.mean_i, mean_q - self.mean_q
+        weight = self.count * count / total
+        self.mean_i += delta_i * (count / total)
+        self.mean_q += delta_q * (count / total)
+        self.c_ii += c_ii + delta_i ** 2 * weight
+        self.c_qq += c_qq + delta_q ** 2 * weight
+        self.c_iq += c_iq + delta_i * delta_q * weight
+        self.count = total
+
+    @property
+    def mean(self) -> np.ndarray:
+        """ Complex mean I + jQ """
+        return self.mean_i + 1j * self.mean_q
+
+    def covariance(self) -> tuple:
+        """
+        Return the sample (var_i, var_q, cov_iq), nan until there are two repetitions.
+        """
+        if self.count < 2:
+            nans = np.full_like(self.mean_i, np.nan)
+            return nans, nans, nans
+        dof = self.count - 1
+        return self.c_ii / dof, self.c_qq / dof, self.c_iq / dof
+
+    def mean_covariance(self) -> tuple:
+        """
+        Return the (var_i, var_q, cov_iq) of the means, i.e. the covariance divided by the
+        count.
+        """
+        return tuple(value / self.count for value in self.covariance())
+
+    def amplitude(self, debias: bool = False) -> tuple:
+        """
+        Return the amplitude |<I> + j<Q>| and its propagated standard error. With debias,
+        the noise contribution var_i + var_q of the means is subtracted from the squared
+        amplitude, which removes the upward bias at low signal to noise ratio.
+        """
+        var_i, var_q, cov_iq = self.mean_covariance()
+        amp_sq = self.mean_i ** 2 + self.mean_q ** 2
+        if debias:
+            amp_sq = np.maximum(amp_sq - var_i - var_q, 0)
+        amp = np.sqrt(amp_sq)
+        norm_sq = self.mean_i ** 2 + self.mean_q ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            amp_var = (
+                self.mean_i ** 2 * var_i
+                + self.mean_q ** 2 * var_q
+                + 2 * self.mean_i * self.mean_q * cov_iq
+            ) / norm_sq
+        return amp, np.sqrt(amp_var)
+
+    def phase(self) -> tuple:
+        """
+        Return the phase of <I> + j<Q> in radians and its propagated standard error.
+        """
+        var_i, var_q, cov_iq = self.mean_covariance()
+        norm_sq = self.mean_i ** 2 + self.mean_q ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            phase_var = (
+                self.mean_q ** 2 * var_i
+                + self.mean_i ** 2 * var_q
+                - 2 * self.mean_i * self.mean_q * cov_iq
+            ) / norm_sq ** 2
+        return np.arctan2(self.mean_q, self.mean_i), np.sqrt(phase_var)
+
+    def optimal_angle(self) -> float:
+        """
+        Angle of the axis along which the means vary the most over the sweep, the principal
+        axis of the I/Q means.
+        """
+        delta_i = self.mean_i - self.mean_i.mean()
+        delta_q = self.mean_q - self.mean_q.mean()
+        return 0.5 * np.arctan2(
+            2 * (delta_i * delta_q).sum(), (delta_i ** 2).sum() - (delta_q ** 2).sum()
+        )
+
+    def projection(self, angle: float = None) -> tuple:
+        """
+        Return the means projected on the axis at "angle" radians in the I/Q plane, by
+        default the optimal_angle, and their standard errors. Unlike the amplitude, the
+        projection is linear, so it keeps the sign of the signal and is not biased by the
+        noise.
+        """
+        angle = self.optimal_angle() if angle is None else angle
+        cos, sin = np.cos(angle), np.sin(angle)
+        var_i, var_q, cov_iq = self.mean_covariance()
+        values = self.mean_i * cos + self.mean_q * sin
+        variance = cos ** 2 * var_i + sin ** 2 * var_q + 2 * cos * sin * cov_iq
+        return values, np.sqrt(variance)
+
+    def state(self) -> dict:
+        """
+        Return the accumulator as a dictionary, see IQStats.from_state.
+        """
+        return {
+            "count": self.count,
+            "mean_i": self.mean_i,
+            "mean_q": self.mean_q,
+            "c_ii": self.c_ii,
+            "c_qq": self.c_qq,
+            "c_iq": self.c_iq,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict, block_rows: int = 256) -> "IQStats":
+        stats = cls(block_rows=block_rows)
+        stats.count = int(state["count"])
+        for key in ("mean_i", "mean_q", "c_ii", "c_qq", "c_iq"):
+            setattr(stats, key, np.array(state[key], dtype=float))
+        return stats
+
+
 """# test by generating random data
 import scipy.stats as sps
 import random
@@ -0,0 +1,60 @@
+""" Qcrew asyncio result streamer v1.0 """
+import asyncio
+import functools
+import time
+from concurrent.futures import Executor
+from typing import AsyncIterator, Optional
+
+from qcrew.codebase.utils.fetcher import Fetcher
+
+
+async def stream(
+    job,
+    num_results: int,
+    min_new: int = 1,
+    min_period: float = 0.0,
+    poll_timeout: float = 1.0,
+    executor: Optional[Executor] = None,
+    **fetcher_kwargs,
+) -> AsyncIterator[tuple]:
+    """Asynchronously iterate over the (count, partial_results) batches of a job, as returned by Fetcher.fetch(). The blocking QM calls run in an executor, so that several jobs, the datasaver and the plots can be followed in one event loop.
+
+    Args:
+        job (QmJob or JobResults): the running job, or its result handles
+        num_results (int): total number of results expected to be fetched
+        min_new (int): minimum number of new results of a batch, fewer near the end of the run
+        min_period (float): minimum time in seconds between two batches, waited without blocking the event loop
+        poll_timeout (float): maximum time in seconds an executor thread waits for results, so that a cancelled stream does not keep a thread busy
+        executor (Executor): where the QM calls run, by default the event loop default executor
+        fetcher_kwargs: passed to Fetcher, e.g. accumulate=True
+
+    Example:
+        async def follow(job, num_results, datasaver):
+            async for (num_so_far, update_results) in stream(job, num_results, min_period=1):
+                datasaver.update_multiple_results(update_results, save=["I", "Q"], group="data")
+
+        async def main():
+            await asyncio.gather(follow(job_1, 1000, datasaver_1), follow(job_2, 500, datasaver_2))
+    """
+    loop = asyncio.get_running_loop()
+    handle = getattr(job, "result_handles", job)
+    # the Fetcher waits for the first results of each tag when created
+    fetcher = await loop.run_in_executor(
+        executor, functools.partial(Fetcher, handle, num_results, **fetcher_kwargs)
+    )
+    last_batch = None
+    try:
+        while fetcher.is_fetching:
+            if min_period and last_batch is not None:
+                wait = last_batch + min_period - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            count, partial_results = await loop.run_in_executor(
+                executor,
+                functools.partial(fetcher.fetch, min_new=min_new, timeout=poll_timeout),
+            )
+            if partial_results:
+                last_batch = time.monotonic()
+                yield count, partial_results
+    finally:
+        fetcher.close()
@@ -16,7 +16,7 @@ from qcrew.codebase.analysis.plot import plot_fit
 from qcrew.codebase.analysis.qm_get_results import update_results
 from qcrew.codebase.utils.fetcher import Fetcher
 from qcrew.codebase.utils.plotter import Plotter
-from qcrew.codebase.utils.statistician import get_std_err
+from qcrew.codebase.utils.statistician import get_std_err, RunningStats
 from qcrew.codebase.utils.fixed_point_library import Fixed, Int
 from qcrew.codebase.datasaver.hdf5_helper import initialise_database, DataSaver
 from qcrew.codebase.analysis import fit
@@ -91,9 +91,8 @@ with program() as t2:
         I_raw.save_all("I")
         Q_raw.save_all("Q")
 
-        # we need these two streams to calculate std err in a single pass
+        # the raw shots, from which RunningStats gives the std err in a single pass
         (I_raw * I_raw + Q_raw * Q_raw).save_all("Y_SQ_RAW")
-        (I_raw * I_raw + Q_raw * Q_raw).average().save_all("Y_SQ_RAW_AVG")
         (I_avg * I_avg + Q_avg * Q_avg).save("Y_AVG")
 
 
@@ -102,9 +101,9 @@ with program() as t2:
 job = stg.qm.execute(t2)
 ############################        INVOKE HELPERS        #############################
 # fetch helper and plot hepler
-fetcher = Fetcher(handle=job.result_handles, num_results=mes.reps)
+fetcher = Fetcher(handle=job.result_handles, num_results=mes.reps, static_tags=["T"])
 plotter = Plotter(title=EXP_NAME, xlabel="Time (ns) ")
-stats = (None, None, None)  # to hold running stats (stderr, mean, variance * (n-1))
+stats = RunningStats()  # to hold running stats (count, mean, variance * (n-1))
 
 # initialise database under dedicated folder
 db = initialise_database(
@@ -127,7 +126,7 @@ with DataSaver(db) as datasaver:
     while fetcher.is_fetching:
         ####################            FETCH PARTIAL RESULTS         ##################
 
-        (num_so_far, update_results) = fetcher.fetch()
+        (num_so_far, update_results) = fetcher.fetch(min_new=1, min_period=1)
         if not update_results:  # empty dict return means no new results are available
             continue
         ####################            LIVE SAVE RESULTS         ######################
@@ -136,15 +135,13 @@ with DataSaver(db) as datasaver:
         ##########            CALCULATE RUNNING MEAN STANDARD ERROR         ############
 
         ys_raw = np.sqrt(update_results["Y_SQ_RAW"])
-        ys_raw_avg = np.sqrt(update_results["Y_SQ_RAW_AVG"])
-        stats = get_std_err(ys_raw, ys_raw_avg, num_so_far, *stats)
+        stats.update(ys_raw)
 
         #################            LIVE PLOT AVAILABLE RESULTS         ###############
 
         ys = np.sqrt(update_results["Y_AVG"])  # latest batch of average signal
         xs = update_results["A"]
-        plotter.live_plot(xs, ys, num_so_far, fit_fn=mes.fit_fn, err=stats[0])
-        time.sleep(1)  # prevent over-fetching, over-saving, ulta-fast live plotting
+        plotter.live_plot(xs, ys, num_so_far, fit_fn=mes.fit_fn, err=stats.std_err)
 
     #######################         SAVE REMAINING DATA         ########################
 